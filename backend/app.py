@@ -1,4 +1,4 @@
-from flask import Flask
+from flask import Flask, g, jsonify
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from dotenv import load_dotenv
@@ -10,12 +10,27 @@ load_dotenv()
 app = Flask(__name__)
 app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET', 'your-secret-key-change-in-production')
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(days=7)
+# Only GET /api/requests/stream reads a token from the query string
+app.config['JWT_QUERY_STRING_NAME'] = 'token'
 app.config['CORS_ORIGINS'] = [os.getenv('FRONTEND_URL', 'http://localhost:3000')]
 
 # Initialize JWT
 jwt = JWTManager(app)
 
-CORS(app, origins=app.config['CORS_ORIGINS'], supports_credentials=True)
+from middleware.auth import is_token_revoked
+
+@jwt.token_in_blocklist_loader
+def check_token_version(jwt_header, jwt_payload):
+    return is_token_revoked(jwt_payload)
+
+# Browsers may only read (and so echo back) response headers listed here
+CORS(app, origins=app.config['CORS_ORIGINS'], supports_credentials=True, expose_headers=['X-DB-LSN'])
+
+from middleware.metrics import init_app as init_metrics
+from middleware.profiler import init_app as init_profiler
+
+init_metrics(app)
+init_profiler(app)
 
 # Import routes
 from routes import auth, equipment, requests, dashboard
@@ -26,6 +41,29 @@ app.register_blueprint(equipment.bp, url_prefix='/api/equipment')
 app.register_blueprint(requests.bp, url_prefix='/api/requests')
 app.register_blueprint(dashboard.bp, url_prefix='/api/dashboard')
 
+from config.database import PoolTimeout, init_app as init_database
+from middleware.cache import init_app as init_cache
+from services.maintenance import init_app as init_maintenance
+
+init_database(app)
+init_cache(app)
+init_maintenance(app)
+
+@app.errorhandler(PoolTimeout)
+def handle_pool_timeout(e):
+    response = jsonify({'error': 'Service busy, please retry'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+@app.after_request
+def apply_pool_backpressure(response):
+    # Handlers report every failure as 500; surface pool exhaustion as 503
+    if response.status_code == 500 and g.get('db_pool_timeout'):
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+    return response
+
 @app.route('/health')
 def health():
     return {'status': 'OK', 'message': 'Server is running'}, 200
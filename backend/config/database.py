@@ -1,51 +1,730 @@
+import hashlib
+import itertools
 import os
+import queue
+import threading
+import time
+import uuid
 import psycopg2
-from psycopg2 import pool
+import psycopg2.errors
+import psycopg2.extensions
+from contextlib import contextmanager
 from dotenv import load_dotenv
+from flask import current_app, g, has_request_context, jsonify, request
+from services.cache import TTLCache
 
 load_dotenv()
 
+# Pool sizing and health settings
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', 1))
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', 20))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 5))
+DB_POOL_MAX_WAITERS = int(os.getenv('DB_POOL_MAX_WAITERS', 100))
+DB_POOL_MAX_IDLE = float(os.getenv('DB_POOL_MAX_IDLE', 300))
+DB_POOL_MAX_LIFETIME = float(os.getenv('DB_POOL_MAX_LIFETIME', 3600))
+DB_POOL_HEALTH_CHECK_AFTER = float(os.getenv('DB_POOL_HEALTH_CHECK_AFTER', 30))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 30000))
+# Seconds to wait for a new connection; bounds how long an unreachable
+# server (say a blackholed replica during a lag check) can stall a request
+DB_CONNECT_TIMEOUT = int(os.getenv('DB_CONNECT_TIMEOUT', 3))
+
+# Read replicas: comma-separated host[:port], same database and credentials
+DB_REPLICA_HOSTS = [host.strip() for host in os.getenv('DB_REPLICA_HOSTS', '').split(',') if host.strip()]
+DB_REPLICA_MAX_LAG = float(os.getenv('DB_REPLICA_MAX_LAG', 5))
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv('DB_REPLICA_CHECK_INTERVAL', 2))
+DB_REPLICA_STRATEGY = os.getenv('DB_REPLICA_STRATEGY', 'round_robin')
+# How long a client's reads stay on the primary after it writes
+DB_STICKY_PRIMARY_SECONDS = float(os.getenv('DB_STICKY_PRIMARY_SECONDS', 10))
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes free within the checkout timeout"""
+
+# Called as listener(cursor, query, seconds) after every statement
+statement_listeners = []
+
+def record_statement(cursor, query, elapsed):
+    """Count a statement against the current request and notify listeners"""
+    if has_request_context():
+        g.db_statements = g.get('db_statements', 0) + 1
+        g.db_time = g.get('db_time', 0.0) + elapsed
+    for listener in statement_listeners:
+        listener(cursor, query, elapsed)
+
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    """Cursor that times every statement it sends"""
+    
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            record_statement(self, query, time.perf_counter() - started)
+    
+    def copy_expert(self, sql, file, size=8192):
+        started = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            record_statement(self, sql, time.perf_counter() - started)
+
+class PreparingConnection(psycopg2.extensions.connection):
+    """Connection that remembers which named queries it has prepared
+    
+    Prepared statements live as long as the server session, so a new or
+    recycled connection starts empty and prepares again on first use.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+        self.pool = None
+
+# Every NamedQuery by name, so each name maps to exactly one statement
+named_queries = {}
+
+class NamedQuery:
+    """A statement prepared once per connection and run with EXECUTE
+    
+    The SQL uses the usual %s placeholders; `types` optionally pins the
+    parameter types for PREPARE.
+    """
+    
+    def __init__(self, name, sql, types=()):
+        self.name = name
+        self.sql = sql
+        parts = sql.replace('%%', '%').split('%s')
+        body = parts[0] + ''.join(f'${i}{part}' for i, part in enumerate(parts[1:], start=1))
+        signature = f" ({', '.join(types)})" if types else ''
+        self.prepare_sql = f'PREPARE {name}{signature} AS {body}'
+        params = len(parts) - 1
+        self.execute_sql = f"EXECUTE {name} ({', '.join(['%s'] * params)})" if params else f'EXECUTE {name}'
+    
+    def execute(self, cursor, params=None):
+        """Run on cursor, preparing the statement on its connection if needed"""
+        prepared = getattr(cursor.connection, 'prepared', None)
+        if prepared is None:
+            # A connection made outside the pool: run the plain SQL
+            cursor.execute(self.sql, params)
+            return
+        if self.name not in prepared:
+            cursor.execute(self.prepare_sql)
+            prepared.add(self.name)
+        try:
+            cursor.execute(self.execute_sql, params)
+        except psycopg2.errors.InvalidSqlStatementName:
+            # The session was reset under us; prepare again next time
+            prepared.discard(self.name)
+            raise
+
+def register_query(name, sql, types=()):
+    """Add a named query to the registry and return it"""
+    if name in named_queries:
+        raise ValueError(f'Query {name} is already registered')
+    query = named_queries[name] = NamedQuery(name, sql, types)
+    return query
+
+class ConnectionPool:
+    """Thread-safe connection pool with a bounded wait queue.
+    
+    Checkouts block for up to `timeout` seconds when every connection is busy
+    and fail fast once `max_waiters` threads are already queued. Connections
+    are pinged after sitting idle, and recycled when closed, too old or idle
+    for too long.
+    """
+    
+    def __init__(self, minconn, maxconn, timeout, max_waiters, max_idle,
+                 max_lifetime, health_check_after, **connect_kwargs):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_waiters = max_waiters
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.health_check_after = health_check_after
+        self.connect_kwargs = connect_kwargs
+        
+        self._cond = threading.Condition()
+        self._idle = []           # (conn, created_at, last_used), most recent last
+        self._created = {}        # id(conn) -> created_at for checked-out connections
+        self._size = 0            # open connections plus ones being opened
+        self._waiters = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._recycled = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        
+        for _ in range(minconn):
+            self._idle.append((self._connect(), time.monotonic(), time.monotonic()))
+            self._size += 1
+    
+    def _connect(self):
+        conn = psycopg2.connect(**self.connect_kwargs)
+        # Lets return_db_connection hand it back to the pool it came from
+        conn.pool = self
+        return conn
+    
+    def _is_healthy(self, conn, created_at, last_used):
+        now = time.monotonic()
+        if conn.closed or now - created_at > self.max_lifetime or now - last_used > self.max_idle:
+            return False
+        if now - last_used > self.health_check_after:
+            try:
+                # A plain cursor keeps the ping out of request metrics
+                cursor = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+                cursor.execute('SELECT 1')
+                cursor.close()
+                conn.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+    
+    def getconn(self):
+        """Check out a connection, waiting up to the pool timeout"""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        with self._cond:
+            if not self._idle and self._size >= self.maxconn and self._waiters >= self.max_waiters:
+                self._timeouts += 1
+                raise PoolTimeout('Connection pool wait queue is full')
+            self._waiters += 1
+            try:
+                while True:
+                    if self._idle:
+                        entry = self._idle.pop()
+                        break
+                    if self._size < self.maxconn:
+                        self._size += 1
+                        entry = None
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(f'No database connection available within {self.timeout}s')
+                    self._cond.wait(remaining)
+            finally:
+                self._waiters -= 1
+        
+        # Connect and health-check outside the lock
+        try:
+            if entry is not None and not self._is_healthy(*entry):
+                self._close(entry[0])
+                with self._cond:
+                    self._recycled += 1
+                entry = None
+            if entry is None:
+                entry = (self._connect(), time.monotonic(), None)
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        
+        conn, created_at = entry[0], entry[1]
+        waited = time.monotonic() - started
+        with self._cond:
+            self._created[id(conn)] = created_at
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return conn
+    
+    def putconn(self, conn, close=False):
+        """Return a connection; broken or mid-transaction connections are reset or dropped"""
+        if not conn.closed and not close:
+            try:
+                if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                close = True
+        
+        with self._cond:
+            created_at = self._created.pop(id(conn), time.monotonic())
+            if close or conn.closed:
+                self._size -= 1
+                self._close(conn)
+            else:
+                self._idle.append((conn, created_at, time.monotonic()))
+                self._reap()
+            self._cond.notify()
+    
+    def _reap(self):
+        """Close idle connections beyond minconn that have not been used for max_idle"""
+        now = time.monotonic()
+        while len(self._idle) > self.minconn and now - self._idle[0][2] > self.max_idle:
+            conn = self._idle.pop(0)[0]
+            self._size -= 1
+            self._recycled += 1
+            self._close(conn)
+    
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+    
+    def closeall(self):
+        with self._cond:
+            for conn, _, _ in self._idle:
+                self._close(conn)
+            self._size -= len(self._idle)
+            self._idle = []
+    
+    def stats(self):
+        """Snapshot of pool utilization"""
+        with self._cond:
+            return {
+                'min_size': self.minconn,
+                'max_size': self.maxconn,
+                'size': self._size,
+                'in_use': len(self._created),
+                'idle': len(self._idle),
+                'waiters': self._waiters,
+                'checkouts': self._checkouts,
+                'timeouts': self._timeouts,
+                'recycled': self._recycled,
+                'checkout_wait_avg_ms': round(self._wait_total / self._checkouts * 1000, 3) if self._checkouts else 0.0,
+                'checkout_wait_max_ms': round(self._wait_max * 1000, 3)
+            }
+
 # Create connection pool (lazy initialization)
 connection_pool = None
+_pool_lock = threading.Lock()
+
+def make_pool(host, port, minconn=DB_POOL_MIN):
+    """A ConnectionPool for one server, with the shared pool settings"""
+    return ConnectionPool(
+        minconn,
+        DB_POOL_MAX,
+        timeout=DB_POOL_TIMEOUT,
+        max_waiters=DB_POOL_MAX_WAITERS,
+        max_idle=DB_POOL_MAX_IDLE,
+        max_lifetime=DB_POOL_MAX_LIFETIME,
+        health_check_after=DB_POOL_HEALTH_CHECK_AFTER,
+        host=host,
+        port=port,
+        database=os.getenv('DB_NAME', 'equipment_lending'),
+        user=os.getenv('DB_USER', 'postgres'),
+        password=os.getenv('DB_PASSWORD', 'postgres'),
+        options=f'-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}',
+        connect_timeout=DB_CONNECT_TIMEOUT,
+        cursor_factory=InstrumentedCursor,
+        connection_factory=PreparingConnection
+    )
+
+def open_dedicated_connection():
+    """Long-lived autocommit connection to the primary, outside the pools
+    
+    For sessions that must stay open and on the primary: LISTEN (notifications
+    are only delivered there) and session advisory locks.
+    """
+    conn = psycopg2.connect(
+        host=os.getenv('DB_HOST', 'localhost'),
+        port=os.getenv('DB_PORT', '5432'),
+        database=os.getenv('DB_NAME', 'equipment_lending'),
+        user=os.getenv('DB_USER', 'postgres'),
+        password=os.getenv('DB_PASSWORD', 'postgres'),
+        connect_timeout=DB_CONNECT_TIMEOUT
+    )
+    conn.autocommit = True
+    return conn
 
 def init_pool():
     """Initialize the connection pool"""
     global connection_pool
-    if connection_pool is None:
-        try:
-            connection_pool = psycopg2.pool.SimpleConnectionPool(
-                1,
-                20,
-                host=os.getenv('DB_HOST', 'localhost'),
-                port=os.getenv('DB_PORT', '5432'),
-                database=os.getenv('DB_NAME', 'equipment_lending'),
-                user=os.getenv('DB_USER', 'postgres'),
-                password=os.getenv('DB_PASSWORD', 'postgres')
-            )
-        except Exception as e:
-            print(f"Error creating connection pool: {e}")
-            raise
+    with _pool_lock:
+        if connection_pool is None:
+            try:
+                connection_pool = make_pool(os.getenv('DB_HOST', 'localhost'), os.getenv('DB_PORT', '5432'))
+            except Exception as e:
+                print(f"Error creating connection pool: {e}")
+                raise
 
 def get_db_connection():
     """Get a database connection from the pool"""
     global connection_pool
     if connection_pool is None:
         init_pool()
-    return connection_pool.getconn()
+    try:
+        return connection_pool.getconn()
+    except PoolTimeout:
+        if has_request_context():
+            # Lets the app answer 503 even when a handler swallows the error
+            g.db_pool_timeout = True
+        raise
 
 def return_db_connection(conn):
-    """Return a connection to the pool"""
-    connection_pool.putconn(conn)
+    """Return a connection to the pool it came from (primary or replica)"""
+    (getattr(conn, 'pool', None) or connection_pool).putconn(conn)
+
+def get_pool_stats():
+    """Pool utilization, or None before the first connection is made"""
+    return connection_pool.stats() if connection_pool is not None else None
+
+# Whether the server is a standby, how far it has replayed, and the age of
+# the last transaction it replayed
+REPLICA_LAG_QUERY = '''SELECT pg_is_in_recovery(), pg_last_wal_replay_lsn()::text,
+    EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())'''
+
+# Sent after every committed write and echoed back by the client: the
+# primary's WAL position its next reads must reflect
+LSN_HEADER = 'X-DB-LSN'
+
+def parse_lsn(value):
+    """'16/B374D848' -> int; raises ValueError on malformed input"""
+    high, low = value.split('/')
+    return (int(high, 16) << 32) + int(low, 16)
+
+_primary_probe = None
+_probe_lock = threading.Lock()
+
+def get_primary_lsn():
+    """The primary's current WAL position, or None when it cannot be read
+    
+    Uses one long-lived connection outside the pool, so lag checks never
+    wait behind requests for a pooled connection.
+    """
+    global _primary_probe
+    with _probe_lock:
+        try:
+            if _primary_probe is None or _primary_probe.closed:
+                _primary_probe = open_dedicated_connection()
+            with _primary_probe.cursor() as cursor:
+                cursor.execute('SELECT pg_current_wal_lsn()::text')
+                return parse_lsn(cursor.fetchone()[0])
+        except psycopg2.Error:
+            if _primary_probe is not None:
+                _primary_probe.close()
+            _primary_probe = None
+            return None
+
+class Replica:
+    """A read replica's pool plus its last measured replication lag"""
+    
+    def __init__(self, name, pool):
+        self.name = name
+        self.pool = pool
+        self.lag = None
+        self.replay_lsn = None
+        self.checked_at = None
+        self._check_lock = threading.Lock()
+    
+    def is_usable(self):
+        """Lag within DB_REPLICA_MAX_LAG, re-measured every DB_REPLICA_CHECK_INTERVAL
+        
+        One thread measures at a time; the others use the last reading.
+        """
+        due = self.checked_at is None or time.monotonic() - self.checked_at >= DB_REPLICA_CHECK_INTERVAL
+        if due and self._check_lock.acquire(blocking=False):
+            try:
+                self.lag = self.measure_lag()
+            finally:
+                self.checked_at = time.monotonic()
+                self._check_lock.release()
+        return self.lag is not None and self.lag <= DB_REPLICA_MAX_LAG
+    
+    def measure_lag(self):
+        """Zero when the replica has replayed up to the primary's current
+        position, otherwise the age of the last transaction it replayed
+        
+        Comparing with the primary (read first) also catches a replica that
+        has fallen behind on receiving WAL, not just on replaying it.
+        """
+        primary_lsn = get_primary_lsn()
+        if primary_lsn is None:
+            return None
+        try:
+            conn = self.pool.getconn()
+        except (PoolTimeout, psycopg2.Error):
+            return None
+        try:
+            # A plain cursor keeps the probe out of request metrics
+            cursor = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+            cursor.execute(REPLICA_LAG_QUERY)
+            in_recovery, replay_lsn, age = cursor.fetchone()
+            cursor.close()
+            conn.rollback()
+        except psycopg2.Error:
+            return None
+        finally:
+            self.pool.putconn(conn)
+        
+        if not in_recovery or replay_lsn is None:
+            return None
+        self.replay_lsn = parse_lsn(replay_lsn)
+        if self.replay_lsn >= primary_lsn:
+            return 0.0
+        return float(age) if age is not None else None
+    
+    def has_replayed(self, conn, lsn):
+        """Whether this replica (conn is one of its connections) has replayed lsn"""
+        if self.replay_lsn is not None and self.replay_lsn >= lsn:
+            return True
+        try:
+            cursor = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+            cursor.execute('SELECT pg_last_wal_replay_lsn()::text')
+            replay_lsn = cursor.fetchone()[0]
+            cursor.close()
+            conn.rollback()
+        except psycopg2.Error:
+            return False
+        if replay_lsn is None:
+            return False
+        self.replay_lsn = max(self.replay_lsn or 0, parse_lsn(replay_lsn))
+        return self.replay_lsn >= lsn
+    
+    def mark_down(self):
+        """Stop routing here until the next lag check succeeds"""
+        self.lag = None
+        self.checked_at = time.monotonic()
+    
+    def load(self):
+        stats = self.pool.stats()
+        return stats['in_use'] + stats['waiters']
+
+replicas = None
+_replica_turn = itertools.count()
+
+# Clients that wrote recently through this process, by a hash of their
+# Authorization header; a fallback for clients that do not echo LSN_HEADER
+sticky_sessions = TTLCache(DB_STICKY_PRIMARY_SECONDS)
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+def get_replicas():
+    global replicas
+    if replicas is None:
+        with _pool_lock:
+            if replicas is None:
+                built = []
+                for address in DB_REPLICA_HOSTS:
+                    host, _, port = address.partition(':')
+                    # Connect lazily, so a replica that is down cannot block startup
+                    built.append(Replica(address, make_pool(host, port or '5432', minconn=0)))
+                replicas = built
+    return replicas
+
+def choose_replica():
+    """A replica within the lag limit, or None to use the primary"""
+    usable = [replica for replica in get_replicas() if replica.is_usable()]
+    if not usable:
+        return None
+    if DB_REPLICA_STRATEGY == 'least_loaded':
+        return min(usable, key=lambda replica: replica.load())
+    return usable[next(_replica_turn) % len(usable)]
+
+def get_session_key():
+    """Identify the client for read-your-writes stickiness"""
+    auth = request.headers.get('Authorization')
+    return hashlib.sha256(auth.encode('utf-8')).hexdigest() if auth else None
+
+def primary_only(f):
+    """Mark a view whose every read must come from the primary
+    
+    Checked when the request's connection is first checked out, so it also
+    covers queries the view's decorators run before it (auth, ETags).
+    Outer decorators copy the mark through functools.wraps.
+    """
+    f.db_primary_only = True
+    return f
+
+def can_read_from_replica():
+    """Read-only request from a client with no recent writes, unless the
+    view is marked primary_only"""
+    if not DB_REPLICA_HOSTS or not has_request_context() or request.method not in READ_METHODS:
+        return False
+    view = current_app.view_functions.get(request.endpoint)
+    if getattr(view, 'db_primary_only', False):
+        return False
+    key = get_session_key()
+    return key is None or sticky_sessions.get(key) is None
+
+def get_required_lsn():
+    """WAL position the client's last write committed at (LSN_HEADER), if sent"""
+    value = request.headers.get(LSN_HEADER)
+    if not value:
+        return None
+    try:
+        return parse_lsn(value)
+    except ValueError:
+        return None
+
+def get_read_connection():
+    """Replica connection when the current request may read from one, else primary
+    
+    A client that sends LSN_HEADER only reads from a replica that has
+    replayed its last write, whichever worker handled that write.
+    """
+    if can_read_from_replica():
+        replica = choose_replica()
+        if replica is not None:
+            try:
+                conn = replica.pool.getconn()
+            except (PoolTimeout, psycopg2.Error):
+                replica.mark_down()
+            else:
+                required = get_required_lsn()
+                if required is None or replica.has_replayed(conn, required):
+                    return conn
+                replica.pool.putconn(conn)
+    return get_db_connection()
+
+def get_replica_stats():
+    """Lag and pool utilization per configured replica"""
+    return [
+        {'name': replica.name, 'lag': replica.lag, **replica.pool.stats()}
+        for replica in (replicas or [])
+    ]
+
+def is_replica_connection(conn):
+    """Whether conn came from a replica's pool rather than the primary's"""
+    pool = getattr(conn, 'pool', None)
+    return pool is not None and pool is not connection_pool
+
+def get_request_connection():
+    """Connection pinned to the current request, checked out on first use
+    
+    Read-only requests go to a replica when one is healthy and has caught
+    up with the client's last write (see get_read_connection).
+    """
+    if 'db_conn' not in g:
+        g.db_conn = get_read_connection()
+    return g.db_conn
+
+def on_commit(callback):
+    """Run callback once the current request's transaction has committed
+    
+    Outside a request query_db commits immediately, so the callback runs now.
+    """
+    if has_request_context():
+        g.setdefault('db_on_commit', []).append(callback)
+    else:
+        callback()
+
+def send_commit_lsn(conn, response):
+    """Tell the client where its write landed, so any worker can keep its
+    reads off replicas that have not replayed it yet"""
+    try:
+        cursor = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+        cursor.execute('SELECT pg_current_wal_lsn()::text')
+        response.headers[LSN_HEADER] = cursor.fetchone()[0]
+        cursor.close()
+        conn.rollback()
+    except psycopg2.Error:
+        # The write is committed either way; the client just loses the hint
+        conn.rollback()
+
+def commit_request_transaction():
+    """Commit the request's work so far and give its connection back now
+    
+    For handlers about to spend a while on work that needs no database,
+    such as hashing a password; a later query_db checks out a new one.
+    """
+    conn = g.pop('db_conn', None)
+    if conn is None:
+        return
+    callbacks = g.pop('db_on_commit', [])
+    try:
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        return_db_connection(conn)
+    for callback in callbacks:
+        callback()
+
+def finish_request_transaction(response):
+    """Commit the request's unit of work on success, roll it back otherwise"""
+    conn = g.pop('db_conn', None)
+    callbacks = g.pop('db_on_commit', [])
+    if conn is None:
+        return response
+    committed = False
+    try:
+        if response.status_code < 400:
+            conn.commit()
+            committed = True
+            if request.method not in READ_METHODS and DB_REPLICA_HOSTS:
+                send_commit_lsn(conn, response)
+                key = get_session_key()
+                if key is not None:
+                    sticky_sessions.set(key, True)
+        else:
+            conn.rollback()
+    except Exception as e:
+        conn.rollback()
+        response = jsonify({'error': str(e)})
+        response.status_code = 500
+    finally:
+        return_db_connection(conn)
+    if committed:
+        for callback in callbacks:
+            callback()
+    return response
+
+def release_request_connection(exc=None):
+    """Roll back and release a connection left behind by an unhandled error"""
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        try:
+            conn.rollback()
+        finally:
+            return_db_connection(conn)
+
+def init_app(app):
+    """Give every request one pinned connection and one transaction"""
+    app.after_request(finish_request_transaction)
+    app.teardown_request(release_request_connection)
+
+def execute(cursor, query, params=None):
+    """Run raw SQL or a NamedQuery on cursor"""
+    if isinstance(query, NamedQuery):
+        query.execute(cursor, params)
+    else:
+        cursor.execute(query, params)
 
 def query_db(query, params=None, fetch_one=False, fetch_all=False):
-    """Execute a database query"""
-    global connection_pool
-    if connection_pool is None:
-        init_pool()
+    """Execute a database query (raw SQL or a NamedQuery)
+    
+    Inside a request every call shares the request's connection and
+    transaction, which is committed once when the response is ready.
+    Outside a request each call commits on its own.
+    """
+    if has_request_context():
+        cursor = get_request_connection().cursor()
+        try:
+            execute(cursor, query, params)
+            if fetch_one:
+                return cursor.fetchone()
+            if fetch_all:
+                return cursor.fetchall()
+            return None
+        finally:
+            cursor.close()
+    return query_own_connection(query, params, fetch_one, fetch_all)
+
+def query_primary(query, params=None, fetch_one=False, fetch_all=False):
+    """query_db, but always answered by the primary
+    
+    For small lookups that must never be stale, such as token versions,
+    even on requests that read from a replica. Uses the request's
+    connection when that is (or will be) the primary; otherwise runs on
+    a primary connection of its own and commits at once.
+    """
+    if has_request_context():
+        conn = g.get('db_conn')
+        if (conn is None and not can_read_from_replica()) or (conn is not None and not is_replica_connection(conn)):
+            return query_db(query, params, fetch_one, fetch_all)
+    return query_own_connection(query, params, fetch_one, fetch_all)
+
+def query_own_connection(query, params=None, fetch_one=False, fetch_all=False):
+    """Run one statement on a primary connection of its own and commit it"""
     conn = get_db_connection()
     try:
         cursor = conn.cursor()
-        cursor.execute(query, params)
+        execute(cursor, query, params)
         
         if fetch_one:
             result = cursor.fetchone()
@@ -63,3 +742,124 @@ def query_db(query, params=None, fetch_one=False, fetch_all=False):
     finally:
         return_db_connection(conn)
 
+@contextmanager
+def transaction():
+    """Run several statements on one connection and commit them together
+    
+    Inside a request this is the request's own transaction; the commit
+    happens with everything else when the response is ready.
+    """
+    if has_request_context():
+        cursor = get_request_connection().cursor()
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+        return
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        yield cursor
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        return_db_connection(conn)
+
+def iter_query(query, params=None, itersize=2000):
+    """Yield rows from a server-side (named) cursor, itersize rows per round trip"""
+    conn = get_read_connection()
+    cursor = conn.cursor(name=f'stream_{uuid.uuid4().hex}')
+    cursor.itersize = itersize
+    try:
+        cursor.execute(query, params)
+        for row in cursor:
+            yield row
+    finally:
+        try:
+            cursor.close()
+            conn.rollback()
+        finally:
+            return_db_connection(conn)
+
+class _QueueWriter:
+    """File-like sink handing COPY output to a bounded queue"""
+    
+    def __init__(self, chunks, stop):
+        self.chunks = chunks
+        self.stop = stop
+    
+    def write(self, data):
+        while not self.stop.is_set():
+            try:
+                self.chunks.put(data, timeout=0.5)
+                return len(data)
+            except queue.Full:
+                continue
+        raise IOError('Stream consumer went away')
+
+# How often a waiting export checks that its COPY thread is still alive
+COPY_POLL_INTERVAL = 1.0
+
+def copy_to_stream(query, params=None, max_chunks=64):
+    """Yield the output of COPY ... TO STDOUT as it is produced
+    
+    COPY runs on its own connection in a helper thread; a bounded queue
+    applies backpressure, and closing the generator aborts the COPY.
+    Wrap it in stream_with_context to read from a replica.
+    """
+    chunks = queue.Queue(maxsize=max_chunks)
+    stop = threading.Event()
+    done = object()
+    # Checked out on the first next(), once the response starts streaming,
+    # not when copy_to_stream is called. Routing needs the request context
+    # then, which stream_with_context keeps alive; without it the read goes
+    # to the primary. A response that is never iterated holds nothing.
+    conn = get_read_connection()
+    
+    def run():
+        try:
+            cursor = conn.cursor()
+            sql = cursor.mogrify(query, params).decode('utf-8') if params else query
+            cursor.copy_expert(sql, _QueueWriter(chunks, stop))
+            cursor.close()
+            result = done
+        except Exception as e:
+            result = e
+        finally:
+            return_db_connection(conn)
+        while not stop.is_set():
+            try:
+                chunks.put(result, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+    
+    worker = threading.Thread(target=run, daemon=True)
+    try:
+        worker.start()
+    except Exception:
+        return_db_connection(conn)
+        raise
+    try:
+        while True:
+            try:
+                item = chunks.get(timeout=COPY_POLL_INTERVAL)
+            except queue.Empty:
+                if worker.is_alive():
+                    continue
+                # It may have queued its result just before exiting
+                try:
+                    item = chunks.get_nowait()
+                except queue.Empty:
+                    raise RuntimeError('COPY worker exited without finishing the export')
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
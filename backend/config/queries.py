@@ -0,0 +1,68 @@
+from config.database import register_query
+
+# Hot statements, prepared once per pooled connection and run by name.
+# Keeping each in one place also stops copies of the same SQL drifting apart.
+
+# Columns of a request response; routes append their own WHERE/ORDER BY.
+# Reads go through the history view so archived requests are still found;
+# writes and locks only ever touch the hot borrowing_requests table.
+REQUEST_SELECT = '''SELECT br.id, br.user_id, u.name as user_name, u.email as user_email,
+                  br.equipment_id, e.name as equipment_name, br.request_date,
+                  br.start_date, br.end_date, br.status, br.approved_by, br.approval_date, br.return_date,
+                  br.overdue
+                  FROM borrowing_requests_history br
+                  JOIN users u ON br.user_id = u.id
+                  JOIN equipment e ON br.equipment_id = e.id'''
+
+REQUEST_BY_ID = register_query(
+    'request_by_id', REQUEST_SELECT + ' WHERE br.id = %s', ('int',)
+)
+
+LOCK_REQUEST = register_query(
+    'lock_request',
+    'SELECT id, equipment_id, start_date, end_date, status FROM borrowing_requests WHERE id = %s FOR UPDATE',
+    ('int',)
+)
+
+EQUIPMENT_BY_ID = register_query(
+    'equipment_by_id',
+    'SELECT id, name, category, condition, quantity, description FROM equipment WHERE id = %s',
+    ('int',)
+)
+
+EQUIPMENT_QUANTITY = register_query(
+    'equipment_quantity', 'SELECT id, quantity FROM equipment WHERE id = %s', ('int',)
+)
+
+LOCK_EQUIPMENT = register_query(
+    'lock_equipment', 'SELECT quantity FROM equipment WHERE id = %s FOR UPDATE', ('int',)
+)
+
+# Today's row of the reservation ledger holds the active count
+ACTIVE_COUNTS = register_query(
+    'active_counts',
+    '''SELECT equipment_id, reserved FROM equipment_reservations
+       WHERE equipment_id = ANY(%s) AND day = CURRENT_DATE''',
+    ('int[]',)
+)
+
+PEAK_RESERVED = register_query(
+    'peak_reserved',
+    '''SELECT COALESCE(MAX(reserved), 0) FROM equipment_reservations
+       WHERE equipment_id = %s AND day BETWEEN %s AND %s''',
+    ('int', 'date', 'date')
+)
+
+USER_BY_ID = register_query(
+    'user_by_id', 'SELECT id, email, name, role FROM users WHERE id = %s', ('int',)
+)
+
+USER_BY_EMAIL = register_query(
+    'user_by_email',
+    'SELECT id, email, password, name, role, token_version FROM users WHERE email = %s',
+    ('text',)
+)
+
+USER_TOKEN_VERSION = register_query(
+    'user_token_version', 'SELECT token_version FROM users WHERE id = %s', ('int',)
+)
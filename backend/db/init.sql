@@ -1,5 +1,8 @@
 -- School Equipment Lending Platform Database Schema
 
+-- Trigram matching for fuzzy and substring equipment search
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
 -- Create users table
 CREATE TABLE IF NOT EXISTS users (
   id SERIAL PRIMARY KEY,
@@ -7,10 +10,15 @@ CREATE TABLE IF NOT EXISTS users (
   password VARCHAR(255) NOT NULL,
   name VARCHAR(255) NOT NULL,
   role VARCHAR(50) NOT NULL CHECK (role IN ('student', 'staff', 'admin')),
+  token_version INTEGER NOT NULL DEFAULT 0,
   created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
   updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- CREATE TABLE IF NOT EXISTS skips a table an earlier version of this script
+-- created; bring such tables up to date so re-running it upgrades in place
+ALTER TABLE users ADD COLUMN IF NOT EXISTS token_version INTEGER NOT NULL DEFAULT 0;
+
 -- Create equipment table
 CREATE TABLE IF NOT EXISTS equipment (
   id SERIAL PRIMARY KEY,
@@ -19,10 +27,21 @@ CREATE TABLE IF NOT EXISTS equipment (
   condition VARCHAR(50) NOT NULL CHECK (condition IN ('excellent', 'good', 'fair', 'poor')),
   quantity INTEGER NOT NULL DEFAULT 1,
   description TEXT,
+  search_vector TSVECTOR GENERATED ALWAYS AS (
+    setweight(to_tsvector('english', coalesce(name, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(category, '')), 'B') ||
+    setweight(to_tsvector('english', coalesce(description, '')), 'C')
+  ) STORED,
   created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
   updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+ALTER TABLE equipment ADD COLUMN IF NOT EXISTS search_vector TSVECTOR GENERATED ALWAYS AS (
+  setweight(to_tsvector('english', coalesce(name, '')), 'A') ||
+  setweight(to_tsvector('english', coalesce(category, '')), 'B') ||
+  setweight(to_tsvector('english', coalesce(description, '')), 'C')
+) STORED;
+
 -- Create borrowing_requests table
 CREATE TABLE IF NOT EXISTS borrowing_requests (
   id SERIAL PRIMARY KEY,
@@ -31,7 +50,8 @@ CREATE TABLE IF NOT EXISTS borrowing_requests (
   request_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
   start_date DATE NOT NULL,
   end_date DATE NOT NULL,
-  status VARCHAR(50) NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'approved', 'rejected', 'returned')),
+  status VARCHAR(50) NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'approved', 'rejected', 'returned', 'expired')),
+  overdue BOOLEAN NOT NULL DEFAULT FALSE,
   approved_by INTEGER REFERENCES users(id) ON DELETE SET NULL,
   approval_date TIMESTAMP,
   return_date TIMESTAMP,
@@ -40,12 +60,437 @@ CREATE TABLE IF NOT EXISTS borrowing_requests (
   CHECK (start_date <= end_date)
 );
 
+ALTER TABLE borrowing_requests ADD COLUMN IF NOT EXISTS overdue BOOLEAN NOT NULL DEFAULT FALSE;
+-- Older tables only allow the first four statuses. NOT VALID keeps the
+-- exclusive lock short; existing rows are checked under a weaker lock.
+ALTER TABLE borrowing_requests DROP CONSTRAINT IF EXISTS borrowing_requests_status_check;
+ALTER TABLE borrowing_requests ADD CONSTRAINT borrowing_requests_status_check
+  CHECK (status IN ('pending', 'approved', 'rejected', 'returned', 'expired')) NOT VALID;
+ALTER TABLE borrowing_requests VALIDATE CONSTRAINT borrowing_requests_status_check;
+
+-- Create borrowing_requests_archive table (closed requests moved out of the
+-- hot table by the archival job; ids keep coming from borrowing_requests)
+CREATE TABLE IF NOT EXISTS borrowing_requests_archive (
+  id INTEGER PRIMARY KEY,
+  user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+  equipment_id INTEGER REFERENCES equipment(id) ON DELETE CASCADE,
+  request_date TIMESTAMP,
+  start_date DATE NOT NULL,
+  end_date DATE NOT NULL,
+  status VARCHAR(50) NOT NULL CHECK (status IN ('rejected', 'returned', 'expired')),
+  overdue BOOLEAN NOT NULL DEFAULT FALSE,
+  approved_by INTEGER REFERENCES users(id) ON DELETE SET NULL,
+  approval_date TIMESTAMP,
+  return_date TIMESTAMP,
+  created_at TIMESTAMP,
+  updated_at TIMESTAMP,
+  archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Every request, open or archived, for history reads. Keep the column list
+-- in step with both tables.
+CREATE OR REPLACE VIEW borrowing_requests_history AS
+  SELECT id, user_id, equipment_id, request_date, start_date, end_date, status, overdue,
+         approved_by, approval_date, return_date, created_at, updated_at
+  FROM borrowing_requests
+  UNION ALL
+  SELECT id, user_id, equipment_id, request_date, start_date, end_date, status, overdue,
+         approved_by, approval_date, return_date, created_at, updated_at
+  FROM borrowing_requests_archive;
+
+-- Create equipment_reservations table (approved units per equipment per day)
+CREATE TABLE IF NOT EXISTS equipment_reservations (
+  equipment_id INTEGER NOT NULL REFERENCES equipment(id) ON DELETE CASCADE,
+  day DATE NOT NULL,
+  reserved INTEGER NOT NULL DEFAULT 0 CHECK (reserved >= 0),
+  PRIMARY KEY (equipment_id, day)
+);
+
+-- Create request_events table (change feed behind GET /api/requests/stream)
+CREATE TABLE IF NOT EXISTS request_events (
+  id BIGSERIAL PRIMARY KEY,
+  request_id INTEGER NOT NULL,
+  user_id INTEGER,
+  equipment_id INTEGER,
+  event VARCHAR(20) NOT NULL CHECK (event IN ('created', 'status_changed')),
+  status VARCHAR(50) NOT NULL,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Create maintenance_runs table (one row per background job run)
+CREATE TABLE IF NOT EXISTS maintenance_runs (
+  id BIGSERIAL PRIMARY KEY,
+  job VARCHAR(100) NOT NULL,
+  started_at TIMESTAMP NOT NULL,
+  duration_ms NUMERIC(12, 3) NOT NULL,
+  rows_affected INTEGER NOT NULL DEFAULT 0,
+  error TEXT
+);
+
+-- Create stats_counters table (dashboard totals kept current by triggers)
+CREATE TABLE IF NOT EXISTS stats_counters (
+  scope VARCHAR(50) NOT NULL,
+  key VARCHAR(100) NOT NULL,
+  value BIGINT NOT NULL DEFAULT 0,
+  PRIMARY KEY (scope, key)
+);
+
+-- Create table_versions table (bumped on every write, drives HTTP ETags)
+CREATE TABLE IF NOT EXISTS table_versions (
+  name VARCHAR(100) PRIMARY KEY,
+  version BIGINT NOT NULL DEFAULT 0
+);
+
+-- Create deleted_rows table (tombstones for delta sync)
+CREATE TABLE IF NOT EXISTS deleted_rows (
+  id BIGSERIAL PRIMARY KEY,
+  table_name VARCHAR(100) NOT NULL,
+  row_id INTEGER NOT NULL,
+  owner_id INTEGER,
+  deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Keep updated_at current on every UPDATE path
+CREATE OR REPLACE FUNCTION touch_updated_at() RETURNS TRIGGER AS $$
+BEGIN
+  NEW.updated_at := CURRENT_TIMESTAMP;
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS users_touch_updated_at ON users;
+CREATE TRIGGER users_touch_updated_at BEFORE UPDATE ON users
+  FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
+DROP TRIGGER IF EXISTS equipment_touch_updated_at ON equipment;
+CREATE TRIGGER equipment_touch_updated_at BEFORE UPDATE ON equipment
+  FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
+DROP TRIGGER IF EXISTS borrowing_requests_touch_updated_at ON borrowing_requests;
+CREATE TRIGGER borrowing_requests_touch_updated_at BEFORE UPDATE ON borrowing_requests
+  FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
+
+-- Record a tombstone for every deleted equipment item or request. Requests
+-- moved to the archive in the same statement were not deleted.
+CREATE OR REPLACE FUNCTION log_deleted_equipment() RETURNS TRIGGER AS $$
+BEGIN
+  INSERT INTO deleted_rows (table_name, row_id)
+  SELECT 'equipment', id FROM old_rows;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION log_deleted_borrowing_requests() RETURNS TRIGGER AS $$
+BEGIN
+  INSERT INTO deleted_rows (table_name, row_id, owner_id)
+  SELECT 'borrowing_requests', id, user_id FROM old_rows
+  WHERE NOT EXISTS (SELECT 1 FROM borrowing_requests_archive a WHERE a.id = old_rows.id);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS equipment_log_deleted ON equipment;
+CREATE TRIGGER equipment_log_deleted AFTER DELETE ON equipment
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION log_deleted_equipment();
+DROP TRIGGER IF EXISTS borrowing_requests_log_deleted ON borrowing_requests;
+CREATE TRIGGER borrowing_requests_log_deleted AFTER DELETE ON borrowing_requests
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION log_deleted_borrowing_requests();
+DROP TRIGGER IF EXISTS borrowing_requests_archive_log_deleted ON borrowing_requests_archive;
+CREATE TRIGGER borrowing_requests_archive_log_deleted AFTER DELETE ON borrowing_requests_archive
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION log_deleted_borrowing_requests();
+
+-- Invalidate issued tokens whenever the claims they carry change
+CREATE OR REPLACE FUNCTION bump_token_version() RETURNS TRIGGER AS $$
+BEGIN
+  IF NEW.role IS DISTINCT FROM OLD.role
+     OR NEW.email IS DISTINCT FROM OLD.email
+     OR NEW.name IS DISTINCT FROM OLD.name THEN
+    NEW.token_version := OLD.token_version + 1;
+  END IF;
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS users_bump_token_version ON users;
+CREATE TRIGGER users_bump_token_version
+  BEFORE UPDATE ON users
+  FOR EACH ROW EXECUTE FUNCTION bump_token_version();
+
+-- Keep stats_counters in step with every write, inside the writing transaction.
+-- Statement-level triggers fold a whole bulk statement into one upsert per key.
+CREATE OR REPLACE FUNCTION count_users_stats() RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    INSERT INTO stats_counters (scope, key, value)
+    SELECT 'totals', 'users', COUNT(*) FROM new_rows
+    ON CONFLICT (scope, key) DO UPDATE SET value = stats_counters.value + EXCLUDED.value;
+  ELSE
+    INSERT INTO stats_counters (scope, key, value)
+    SELECT 'totals', 'users', -COUNT(*) FROM old_rows
+    ON CONFLICT (scope, key) DO UPDATE SET value = stats_counters.value + EXCLUDED.value;
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION count_equipment_stats() RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    INSERT INTO stats_counters (scope, key, value)
+    SELECT 'equipment_by_category', category, COUNT(*) FROM new_rows GROUP BY category
+    UNION ALL
+    SELECT 'totals', 'equipment', COUNT(*) FROM new_rows
+    ON CONFLICT (scope, key) DO UPDATE SET value = stats_counters.value + EXCLUDED.value;
+  ELSIF TG_OP = 'DELETE' THEN
+    INSERT INTO stats_counters (scope, key, value)
+    SELECT 'equipment_by_category', category, -COUNT(*) FROM old_rows GROUP BY category
+    UNION ALL
+    SELECT 'totals', 'equipment', -COUNT(*) FROM old_rows
+    ON CONFLICT (scope, key) DO UPDATE SET value = stats_counters.value + EXCLUDED.value;
+  ELSE
+    INSERT INTO stats_counters (scope, key, value)
+    SELECT 'equipment_by_category', category, SUM(delta) FROM (
+      SELECT category, 1 AS delta FROM new_rows
+      UNION ALL
+      SELECT category, -1 AS delta FROM old_rows
+    ) d GROUP BY category HAVING SUM(delta) <> 0
+    ON CONFLICT (scope, key) DO UPDATE SET value = stats_counters.value + EXCLUDED.value;
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION count_borrowing_requests_stats() RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    INSERT INTO stats_counters (scope, key, value)
+    SELECT 'requests_by_status', status, COUNT(*) FROM new_rows GROUP BY status
+    ON CONFLICT (scope, key) DO UPDATE SET value = stats_counters.value + EXCLUDED.value;
+  ELSIF TG_OP = 'DELETE' THEN
+    INSERT INTO stats_counters (scope, key, value)
+    SELECT 'requests_by_status', status, -COUNT(*) FROM old_rows GROUP BY status
+    ON CONFLICT (scope, key) DO UPDATE SET value = stats_counters.value + EXCLUDED.value;
+  ELSE
+    INSERT INTO stats_counters (scope, key, value)
+    SELECT 'requests_by_status', status, SUM(delta) FROM (
+      SELECT status, 1 AS delta FROM new_rows
+      UNION ALL
+      SELECT status, -1 AS delta FROM old_rows
+    ) d GROUP BY status HAVING SUM(delta) <> 0
+    ON CONFLICT (scope, key) DO UPDATE SET value = stats_counters.value + EXCLUDED.value;
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS users_stats_insert ON users;
+CREATE TRIGGER users_stats_insert AFTER INSERT ON users
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION count_users_stats();
+DROP TRIGGER IF EXISTS users_stats_delete ON users;
+CREATE TRIGGER users_stats_delete AFTER DELETE ON users
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION count_users_stats();
+
+DROP TRIGGER IF EXISTS equipment_stats_insert ON equipment;
+CREATE TRIGGER equipment_stats_insert AFTER INSERT ON equipment
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION count_equipment_stats();
+DROP TRIGGER IF EXISTS equipment_stats_update ON equipment;
+CREATE TRIGGER equipment_stats_update AFTER UPDATE ON equipment
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION count_equipment_stats();
+DROP TRIGGER IF EXISTS equipment_stats_delete ON equipment;
+CREATE TRIGGER equipment_stats_delete AFTER DELETE ON equipment
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION count_equipment_stats();
+
+DROP TRIGGER IF EXISTS borrowing_requests_stats_insert ON borrowing_requests;
+CREATE TRIGGER borrowing_requests_stats_insert AFTER INSERT ON borrowing_requests
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION count_borrowing_requests_stats();
+DROP TRIGGER IF EXISTS borrowing_requests_stats_update ON borrowing_requests;
+CREATE TRIGGER borrowing_requests_stats_update AFTER UPDATE ON borrowing_requests
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION count_borrowing_requests_stats();
+DROP TRIGGER IF EXISTS borrowing_requests_stats_delete ON borrowing_requests;
+CREATE TRIGGER borrowing_requests_stats_delete AFTER DELETE ON borrowing_requests
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION count_borrowing_requests_stats();
+
+-- Archived requests still count; a move nets out to zero
+DROP TRIGGER IF EXISTS borrowing_requests_archive_stats_insert ON borrowing_requests_archive;
+CREATE TRIGGER borrowing_requests_archive_stats_insert AFTER INSERT ON borrowing_requests_archive
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION count_borrowing_requests_stats();
+DROP TRIGGER IF EXISTS borrowing_requests_archive_stats_delete ON borrowing_requests_archive;
+CREATE TRIGGER borrowing_requests_archive_stats_delete AFTER DELETE ON borrowing_requests_archive
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION count_borrowing_requests_stats();
+
+-- Bump a table's version once per writing statement
+CREATE OR REPLACE FUNCTION bump_table_version() RETURNS TRIGGER AS $$
+BEGIN
+  INSERT INTO table_versions (name, version) VALUES (TG_TABLE_NAME, 1)
+  ON CONFLICT (name) DO UPDATE SET version = table_versions.version + 1;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS users_bump_version ON users;
+CREATE TRIGGER users_bump_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON users
+  FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+DROP TRIGGER IF EXISTS equipment_bump_version ON equipment;
+CREATE TRIGGER equipment_bump_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON equipment
+  FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+DROP TRIGGER IF EXISTS borrowing_requests_bump_version ON borrowing_requests;
+CREATE TRIGGER borrowing_requests_bump_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON borrowing_requests
+  FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+DROP TRIGGER IF EXISTS borrowing_requests_archive_bump_version ON borrowing_requests_archive;
+CREATE TRIGGER borrowing_requests_archive_bump_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON borrowing_requests_archive
+  FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+DROP TRIGGER IF EXISTS equipment_reservations_bump_version ON equipment_reservations;
+CREATE TRIGGER equipment_reservations_bump_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON equipment_reservations
+  FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+-- Announce token version changes and deletions of users to every app worker
+-- (see services/invalidation.py); delivered only if the transaction commits
+CREATE OR REPLACE FUNCTION notify_user_invalidation() RETURNS TRIGGER AS $$
+DECLARE
+  target users%ROWTYPE;
+BEGIN
+  IF TG_OP = 'DELETE' THEN
+    target := OLD;
+  ELSIF NEW.token_version IS DISTINCT FROM OLD.token_version THEN
+    target := NEW;
+  ELSE
+    RETURN NULL;
+  END IF;
+  PERFORM pg_notify('cache_invalidation', json_build_object(
+    't', 'users', 'id', target.id, 'v', target.token_version, 'o', 'db')::text);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS users_notify_invalidation ON users;
+CREATE TRIGGER users_notify_invalidation AFTER UPDATE OR DELETE ON users
+  FOR EACH ROW EXECUTE FUNCTION notify_user_invalidation();
+
+-- Log request creations and status changes and announce each one to every
+-- app worker (see services/request_events.py); delivered only on commit
+CREATE OR REPLACE FUNCTION log_request_events() RETURNS TRIGGER AS $$
+DECLARE
+  ev request_events%ROWTYPE;
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    FOR ev IN
+      INSERT INTO request_events (request_id, user_id, equipment_id, event, status)
+      SELECT id, user_id, equipment_id, 'created', status FROM new_rows ORDER BY id
+      RETURNING *
+    LOOP
+      PERFORM pg_notify('request_events', json_build_object(
+        'id', ev.id, 'request_id', ev.request_id, 'user_id', ev.user_id,
+        'equipment_id', ev.equipment_id, 'event', ev.event, 'status', ev.status)::text);
+    END LOOP;
+  ELSE
+    FOR ev IN
+      INSERT INTO request_events (request_id, user_id, equipment_id, event, status)
+      SELECT n.id, n.user_id, n.equipment_id, 'status_changed', n.status
+      FROM new_rows n JOIN old_rows o ON o.id = n.id
+      WHERE n.status IS DISTINCT FROM o.status
+      ORDER BY n.id
+      RETURNING *
+    LOOP
+      PERFORM pg_notify('request_events', json_build_object(
+        'id', ev.id, 'request_id', ev.request_id, 'user_id', ev.user_id,
+        'equipment_id', ev.equipment_id, 'event', ev.event, 'status', ev.status)::text);
+    END LOOP;
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS borrowing_requests_events_insert ON borrowing_requests;
+CREATE TRIGGER borrowing_requests_events_insert AFTER INSERT ON borrowing_requests
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION log_request_events();
+DROP TRIGGER IF EXISTS borrowing_requests_events_update ON borrowing_requests;
+CREATE TRIGGER borrowing_requests_events_update AFTER UPDATE ON borrowing_requests
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION log_request_events();
+
+-- Recompute every counter from the base tables (initial load and drift repair)
+CREATE OR REPLACE FUNCTION refresh_stats_counters() RETURNS VOID AS $$
+BEGIN
+  LOCK TABLE stats_counters IN EXCLUSIVE MODE;
+  DELETE FROM stats_counters;
+  INSERT INTO stats_counters (scope, key, value)
+  SELECT 'totals', 'equipment', COUNT(*) FROM equipment
+  UNION ALL
+  SELECT 'totals', 'users', COUNT(*) FROM users
+  UNION ALL
+  SELECT 'equipment_by_category', category, COUNT(*) FROM equipment GROUP BY category
+  UNION ALL
+  SELECT 'requests_by_status', status, COUNT(*) FROM borrowing_requests_history GROUP BY status;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Bring drifted counters back in line without blocking writers: the counts
+-- and counters are read from one snapshot, and only the difference is
+-- added, so increments from transactions committing meanwhile are kept
+CREATE OR REPLACE FUNCTION repair_stats_counters() RETURNS INTEGER AS $$
+DECLARE
+  repaired INTEGER;
+BEGIN
+  WITH expected AS (
+    SELECT 'totals' AS scope, 'equipment' AS key, COUNT(*) AS value FROM equipment
+    UNION ALL
+    SELECT 'totals', 'users', COUNT(*) FROM users
+    UNION ALL
+    SELECT 'equipment_by_category', category, COUNT(*) FROM equipment GROUP BY category
+    UNION ALL
+    SELECT 'requests_by_status', status, COUNT(*) FROM borrowing_requests_history GROUP BY status
+  ), drift AS (
+    SELECT COALESCE(e.scope, s.scope) AS scope, COALESCE(e.key, s.key) AS key,
+           COALESCE(e.value, 0) - COALESCE(s.value, 0) AS delta
+    FROM expected e
+    FULL JOIN stats_counters s ON s.scope = e.scope AND s.key = e.key
+  )
+  INSERT INTO stats_counters (scope, key, value)
+  SELECT scope, key, delta FROM drift WHERE delta <> 0
+  ON CONFLICT (scope, key) DO UPDATE SET value = stats_counters.value + EXCLUDED.value;
+  GET DIAGNOSTICS repaired = ROW_COUNT;
+  RETURN repaired;
+END;
+$$ LANGUAGE plpgsql;
+
 -- Create indexes for better performance
 CREATE INDEX IF NOT EXISTS idx_borrowing_requests_equipment ON borrowing_requests(equipment_id);
 CREATE INDEX IF NOT EXISTS idx_borrowing_requests_user ON borrowing_requests(user_id);
+CREATE INDEX IF NOT EXISTS idx_borrowing_requests_request_date ON borrowing_requests(request_date DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_borrowing_requests_user_request_date ON borrowing_requests(user_id, request_date DESC, id DESC);
 CREATE INDEX IF NOT EXISTS idx_borrowing_requests_dates ON borrowing_requests(start_date, end_date);
 CREATE INDEX IF NOT EXISTS idx_borrowing_requests_status ON borrowing_requests(status);
+CREATE INDEX IF NOT EXISTS idx_borrowing_requests_active ON borrowing_requests(equipment_id, start_date, end_date) WHERE status = 'approved';
+CREATE INDEX IF NOT EXISTS idx_borrowing_requests_pending_start ON borrowing_requests(start_date) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_borrowing_requests_overdue ON borrowing_requests(end_date) WHERE status = 'approved' AND NOT overdue;
+CREATE INDEX IF NOT EXISTS idx_borrowing_requests_closed ON borrowing_requests(updated_at) WHERE status IN ('rejected', 'returned', 'expired');
+CREATE INDEX IF NOT EXISTS idx_borrowing_requests_archive_equipment ON borrowing_requests_archive(equipment_id);
+CREATE INDEX IF NOT EXISTS idx_borrowing_requests_archive_request_date ON borrowing_requests_archive(request_date DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_borrowing_requests_archive_user_request_date ON borrowing_requests_archive(user_id, request_date DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_borrowing_requests_archive_updated_at ON borrowing_requests_archive(updated_at);
+CREATE INDEX IF NOT EXISTS idx_equipment_reservations_day ON equipment_reservations(day);
+CREATE INDEX IF NOT EXISTS idx_request_events_user ON request_events(user_id, id);
+CREATE INDEX IF NOT EXISTS idx_request_events_created_at ON request_events(created_at);
+CREATE INDEX IF NOT EXISTS idx_maintenance_runs_job ON maintenance_runs(job, started_at DESC);
 CREATE INDEX IF NOT EXISTS idx_equipment_category ON equipment(category);
+CREATE INDEX IF NOT EXISTS idx_equipment_updated_at ON equipment(updated_at);
+CREATE INDEX IF NOT EXISTS idx_borrowing_requests_updated_at ON borrowing_requests(updated_at);
+CREATE INDEX IF NOT EXISTS idx_deleted_rows_table_deleted_at ON deleted_rows(table_name, deleted_at);
+CREATE INDEX IF NOT EXISTS idx_equipment_search ON equipment USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS idx_equipment_name_trgm ON equipment USING GIN (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_equipment_description_trgm ON equipment USING GIN (description gin_trgm_ops);
 CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
 CREATE INDEX IF NOT EXISTS idx_users_role ON users(role);
 
@@ -53,11 +498,24 @@ CREATE INDEX IF NOT EXISTS idx_users_role ON users(role);
 -- Password will be properly hashed using bcrypt in the application
 
 -- Insert sample equipment
-INSERT INTO equipment (name, category, condition, quantity, description) VALUES
+-- (only into an empty catalog; ids are serial, so ON CONFLICT never fires)
+INSERT INTO equipment (name, category, condition, quantity, description)
+SELECT * FROM (VALUES
 ('Basketball Set', 'Sports', 'excellent', 5, 'Complete basketball set with balls and hoops'),
 ('Microscope', 'Lab Equipment', 'good', 10, 'Digital microscope for biology lab'),
 ('Camera DSLR', 'Electronics', 'excellent', 3, 'Canon DSLR camera for photography class'),
 ('Guitar', 'Musical Instruments', 'good', 8, 'Acoustic guitar for music lessons'),
 ('Projector', 'Electronics', 'fair', 4, 'LCD projector for presentations')
-ON CONFLICT DO NOTHING;
+) AS sample (name, category, condition, quantity, description)
+WHERE NOT EXISTS (SELECT 1 FROM equipment);
+
+-- Rebuild the reservation ledger from approved bookings
+INSERT INTO equipment_reservations (equipment_id, day, reserved)
+SELECT equipment_id, d::date, COUNT(*)
+FROM borrowing_requests, generate_series(start_date, end_date, interval '1 day') d
+WHERE status = 'approved'
+GROUP BY equipment_id, d::date
+ON CONFLICT (equipment_id, day) DO UPDATE SET reserved = EXCLUDED.reserved;
 
+-- Initialize dashboard counters
+SELECT refresh_stats_counters();
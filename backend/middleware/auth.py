@@ -1,31 +1,93 @@
+import os
+from datetime import timedelta
 from functools import wraps
 from flask import request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from config.database import query_db
+from flask_jwt_extended import (
+    jwt_required, get_jwt_identity, get_jwt, get_jwt_request_location, create_access_token
+)
+from config.database import query_db, query_primary
+from config.queries import USER_BY_ID, USER_TOKEN_VERSION
+from services.cache import TTLCache
+from services.invalidation import subscribe
+
+# How long a user's token version is trusted before it is re-read from the database
+TOKEN_VERSION_TTL = int(os.getenv('TOKEN_VERSION_TTL', 30))
+
+token_versions = TTLCache(TOKEN_VERSION_TTL)
+
+# Lifetime of a token that may only open GET /api/requests/stream. It ends
+# streams opened with it, so clients reconnect (and re-authorize) this often.
+STREAM_TOKEN_TTL = int(os.getenv('STREAM_TOKEN_TTL', 300))
+STREAM_TOKEN_PURPOSE = 'stream'
+
+# Role or identity changes bump token_version; a trigger announces them so
+# every worker revokes old tokens at once instead of after the TTL
+subscribe('users', lambda user_id: token_versions.clear() if user_id is None else token_versions.delete(user_id))
+
+def get_token_version(user_id):
+    """Current token version for a user (-1 if the user no longer exists)"""
+    version = token_versions.get(user_id)
+    if version is None:
+        # From the primary: a lagging replica would re-cache a revoked version
+        user = query_primary(USER_TOKEN_VERSION, (user_id,), fetch_one=True)
+        version = user[0] if user else -1
+        token_versions.set(user_id, version)
+    return version
+
+def is_token_revoked(jwt_payload):
+    """A token is revoked once the user's token version has moved past it"""
+    if 'ver' not in jwt_payload:
+        # Tokens issued before version claims existed are checked in get_current_user
+        return False
+    return get_token_version(int(jwt_payload['sub'])) != jwt_payload['ver']
 
 def token_required(f):
     """Decorator to require JWT token"""
     @wraps(f)
     @jwt_required()
     def decorated(*args, **kwargs):
+        if get_jwt().get('purpose') is not None:
+            # Stream tokens open the event stream and nothing else
+            return jsonify({'error': 'Token not valid for this endpoint'}), 401
         return f(*args, **kwargs)
     return decorated
 
+def stream_token_required(f):
+    """Like token_required, but also accepts a stream token as ?token=<token>
+    
+    A browser EventSource cannot set an Authorization header, and a URL
+    ends up in logs, so only a short-lived stream token may go there.
+    """
+    @wraps(f)
+    @jwt_required(locations=['headers', 'query_string'])
+    def decorated(*args, **kwargs):
+        purpose = get_jwt().get('purpose')
+        in_query = get_jwt_request_location() == 'query_string'
+        if purpose not in (None, STREAM_TOKEN_PURPOSE) or (in_query and purpose is None):
+            return jsonify({'error': 'Token not valid for this endpoint'}), 401
+        return f(*args, **kwargs)
+    return decorated
+
+def create_stream_token():
+    """Short-lived token for the current user that can only open the event stream"""
+    claims = get_jwt()
+    profile = {key: claims[key] for key in ('email', 'name', 'role', 'ver') if key in claims}
+    return create_access_token(
+        identity=claims['sub'],
+        additional_claims={**profile, 'purpose': STREAM_TOKEN_PURPOSE},
+        expires_delta=timedelta(seconds=STREAM_TOKEN_TTL)
+    )
+
 def role_required(*allowed_roles):
     """Decorator to require specific role(s)"""
     def decorator(f):
         @wraps(f)
         @token_required
         def decorated(*args, **kwargs):
-            user_id = get_jwt_identity()
-            # Get user role from database
-            user = query_db(
-                'SELECT role FROM users WHERE id = %s',
-                (user_id,),
-                fetch_one=True
-            )
+            # Role comes from the token claims; no database lookup needed
+            user = get_current_user()
             
-            if not user or user[0] not in allowed_roles:
+            if not user or user['role'] not in allowed_roles:
                 return jsonify({'error': 'Insufficient permissions'}), 403
             
             return f(*args, **kwargs)
@@ -34,12 +96,17 @@ def role_required(*allowed_roles):
 
 def get_current_user():
     """Get current authenticated user"""
+    claims = get_jwt()
+    if 'ver' in claims:
+        return {
+            'id': int(claims['sub']),
+            'email': claims['email'],
+            'name': claims['name'],
+            'role': claims['role']
+        }
+    
     user_id = get_jwt_identity()
-    user = query_db(
-        'SELECT id, email, name, role FROM users WHERE id = %s',
-        (user_id,),
-        fetch_one=True
-    )
+    user = query_db(USER_BY_ID, (user_id,), fetch_one=True)
     if user:
         return {
             'id': user[0],
@@ -48,4 +115,3 @@ def get_current_user():
             'role': user[3]
         }
     return None
-
@@ -0,0 +1,72 @@
+import os
+from datetime import date
+from functools import wraps
+from flask import request, make_response
+from config.database import on_commit, primary_only
+from services.cache import LRUCache
+from services.invalidation import publish, subscribe, start_listener
+
+# Namespace for everything derived from equipment rows or their availability
+EQUIPMENT_CACHE = 'equipment'
+
+# Table announced to other workers when a namespace is invalidated
+NAMESPACE_TABLES = {EQUIPMENT_CACHE: 'equipment'}
+
+# Set to 0 to run without the cross-worker invalidation listener
+CACHE_INVALIDATION_LISTEN = os.getenv('CACHE_INVALIDATION_LISTEN', '1').lower() in ('1', 'true', 'yes')
+
+response_cache = LRUCache(
+    max_entries=int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 1000)),
+    max_bytes=int(os.getenv('RESPONSE_CACHE_MAX_BYTES', 32 * 1024 * 1024)),
+    ttl=float(os.getenv('RESPONSE_CACHE_TTL', 60)) or None
+)
+
+def cached_response(namespace):
+    """Decorator to serve successful JSON responses from the in-process cache
+    
+    The whole request reads from the primary (see primary_only): an
+    invalidation arrives when the primary commits, and a miss served by a
+    lagging replica would re-cache the old data for the whole TTL. Hits
+    only touch the database for the auth and ETag lookups.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            # Availability depends on the current date, so it is part of the key
+            key = (namespace, request.path, tuple(sorted(request.args.items(multi=True))), date.today())
+            body = response_cache.get(key)
+            if body is not None:
+                response = make_response(body, 200)
+                response.mimetype = 'application/json'
+                response.headers['X-Cache'] = 'HIT'
+                return response
+            
+            # Taken before the handler queries anything: if a write commits
+            # and invalidates meanwhile, this response must not be stored
+            generation = response_cache.generation(namespace)
+            response = make_response(f(*args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed:
+                body = response.get_data()
+                response_cache.set(key, body, len(body), generation)
+            response.headers['X-Cache'] = 'MISS'
+            return response
+        return primary_only(decorated)
+    return decorator
+
+def invalidate_cache(namespace, row_id=None):
+    """Drop a namespace once the current transaction commits, here and in
+    every other worker (via NOTIFY in the same transaction)"""
+    on_commit(lambda: response_cache.invalidate(namespace))
+    publish(NAMESPACE_TABLES[namespace], row_id)
+
+subscribe('equipment', lambda row_id: response_cache.invalidate(EQUIPMENT_CACHE))
+
+def ensure_listener():
+    # Started on the first request, so only processes that serve traffic
+    # (not the bcrypt pool's spawned children) open a LISTEN connection
+    start_listener()
+
+def init_app(app):
+    """Apply other workers' invalidations to this worker's caches"""
+    if CACHE_INVALIDATION_LISTEN:
+        app.before_request(ensure_listener)
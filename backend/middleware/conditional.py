@@ -0,0 +1,58 @@
+import hashlib
+from datetime import date
+from functools import wraps
+from flask import request, make_response
+from flask_jwt_extended import get_jwt
+from config.database import query_primary
+
+def get_table_versions(tables):
+    """Current write version of each table (one primary-key lookup)
+    
+    Read from the primary even when the response comes from a replica: a
+    lagging version would answer 304 to a client whose copy a write has
+    already made stale.
+    """
+    rows = query_primary(
+        'SELECT name, version FROM table_versions WHERE name = ANY(%s)',
+        (list(tables),),
+        fetch_all=True
+    )
+    versions = dict(rows)
+    return tuple(versions.get(table, 0) for table in tables)
+
+def conditional(*tables, per_user=False):
+    """Decorator to answer If-None-Match with 304 using table version stamps.
+    
+    The ETag covers the URL, the version of every table the response reads
+    and today's date; with per_user, students get their own scope while
+    staff and admins share one per role.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            scope = None
+            if per_user:
+                claims = get_jwt()
+                scope = claims['sub'] if claims.get('role', 'student') == 'student' else claims['role']
+            
+            stamp = repr((
+                request.path,
+                sorted(request.args.items(multi=True)),
+                get_table_versions(tables),
+                scope,
+                date.today().isoformat()
+            ))
+            etag = hashlib.sha1(stamp.encode('utf-8')).hexdigest()
+            
+            if request.if_none_match.contains(etag):
+                response = make_response('', 304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return decorated
+    return decorator
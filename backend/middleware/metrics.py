@@ -0,0 +1,96 @@
+import os
+import time
+from flask import Response, g, request
+from config.database import get_pool_stats, get_replica_stats
+from middleware.cache import response_cache
+from services.request_events import broker
+from services.metrics import Counter, Histogram, COUNT_BUCKETS, render_sample, format_labels, format_value
+
+# When set, /metrics requires "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+# Labelled by route template (e.g. /api/requests/<int:request_id>) to keep
+# cardinality bounded
+REQUEST_LABELS = ('method', 'endpoint')
+
+request_duration = Histogram(
+    'http_request_duration_seconds', 'Time to produce the response', REQUEST_LABELS
+)
+requests_total = Counter(
+    'http_requests_total', 'Responses by status code', REQUEST_LABELS + ('status',)
+)
+request_db_statements = Histogram(
+    'http_request_db_statements', 'SQL statements executed per request', REQUEST_LABELS,
+    buckets=COUNT_BUCKETS
+)
+request_db_seconds = Histogram(
+    'http_request_db_seconds', 'Time spent in the database per request', REQUEST_LABELS
+)
+
+def route_template():
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+def start_timer():
+    g.request_started = time.perf_counter()
+
+def record_request(response):
+    started = g.get('request_started')
+    if started is None:
+        return response
+    labels = (request.method, route_template())
+    request_duration.observe(time.perf_counter() - started, *labels)
+    requests_total.inc(*labels, str(response.status_code))
+    request_db_statements.observe(g.get('db_statements', 0), *labels)
+    request_db_seconds.observe(g.get('db_time', 0.0), *labels)
+    return response
+
+def render_metrics():
+    lines = []
+    for metric in (request_duration, requests_total, request_db_statements, request_db_seconds):
+        lines.extend(metric.render())
+    
+    pool = get_pool_stats()
+    if pool is not None:
+        lines += render_sample('db_pool_size', 'Open connections', pool['size'])
+        lines += render_sample('db_pool_max_size', 'Connection limit', pool['max_size'])
+        lines += render_sample('db_pool_in_use', 'Connections checked out', pool['in_use'])
+        lines += render_sample('db_pool_idle', 'Idle connections', pool['idle'])
+        lines += render_sample('db_pool_waiters', 'Threads waiting for a connection', pool['waiters'])
+        lines += render_sample('db_pool_checkouts_total', 'Connection checkouts', pool['checkouts'], 'counter')
+        lines += render_sample('db_pool_timeouts_total', 'Checkouts that timed out', pool['timeouts'], 'counter')
+        lines += render_sample('db_pool_recycled_total', 'Connections closed and replaced', pool['recycled'], 'counter')
+    
+    replicas = get_replica_stats()
+    if replicas:
+        for name, help_text, key in (
+            ('db_replica_lag_seconds', 'Last measured replication lag (-1 when unusable)', 'lag'),
+            ('db_replica_in_use', 'Replica connections checked out', 'in_use'),
+            ('db_replica_timeouts_total', 'Replica checkouts that timed out', 'timeouts')
+        ):
+            lines += [f'# HELP {name} {help_text}', f"# TYPE {name} {'counter' if key == 'timeouts' else 'gauge'}"]
+            for replica in replicas:
+                value = replica[key] if replica[key] is not None else -1
+                lines.append(f"{name}{format_labels(('replica',), (replica['name'],))} {format_value(value)}")
+    
+    cache = response_cache.stats()
+    lines += render_sample('response_cache_entries', 'Cached responses', cache['entries'])
+    lines += render_sample('response_cache_bytes', 'Bytes held by the response cache', cache['bytes'])
+    lines += render_sample('response_cache_hits_total', 'Response cache hits', cache['hits'], 'counter')
+    lines += render_sample('response_cache_misses_total', 'Response cache misses', cache['misses'], 'counter')
+    lines += render_sample('sse_open_streams', 'Open request event streams', broker.count())
+    return '\n'.join(lines) + '\n'
+
+def metrics():
+    if METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+        return {'error': 'Unauthorized'}, 401
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+def init_app(app):
+    """Record latency, status and DB usage per route and serve /metrics
+    
+    Register before other after_request hooks: those run in reverse order,
+    so this one sees the final status and its timing includes the commit.
+    """
+    app.before_request(start_timer)
+    app.after_request(record_request)
+    app.add_url_rule('/metrics', 'metrics', metrics)
@@ -0,0 +1,87 @@
+import os
+from flask import g, has_request_context, request
+from config.database import statement_listeners, named_queries
+from services.profiler import QueryProfiler, fingerprint, explain
+
+# Opt-in: profiling adds overhead and EXPLAIN ANALYZE re-runs slow SELECTs
+QUERY_PROFILE = os.getenv('QUERY_PROFILE', '').lower() in ('1', 'true', 'yes')
+
+profiler = QueryProfiler(
+    slow_ms=float(os.getenv('QUERY_PROFILE_SLOW_MS', 100)),
+    explain_first=int(os.getenv('QUERY_PROFILE_EXPLAIN_FIRST', 3)),
+    n_plus_one=int(os.getenv('QUERY_PROFILE_N_PLUS_ONE', 10))
+)
+
+def current_endpoint():
+    if not has_request_context():
+        return None
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+def is_select(key):
+    """True for plain SELECTs, including named queries run with EXECUTE"""
+    words = key.split(None, 2)
+    if words and words[0].upper() == 'EXECUTE' and len(words) > 1:
+        named = named_queries.get(words[1])
+        return named is not None and named.sql.lstrip().upper().startswith('SELECT')
+    return key.upper().startswith('SELECT')
+
+def on_statement(cursor, query, elapsed):
+    key = fingerprint(query, cursor)
+    profiler.record(key, elapsed)
+    
+    profile = g.get('query_profile') if has_request_context() else None
+    if profile is not None:
+        calls, total = profile.get(key, (0, 0.0))
+        profile[key] = (calls + 1, total + elapsed)
+    
+    if elapsed * 1000 < profiler.slow_ms:
+        return
+    
+    plan = None
+    # Only plain SELECTs are safe to run twice; named cursors just DECLARE
+    if cursor.name is None and is_select(key) and profiler.should_explain(key):
+        plan = explain(cursor)
+    
+    endpoint = current_endpoint()
+    profiler.log_slow({
+        'endpoint': endpoint,
+        'fingerprint': key,
+        'ms': round(elapsed * 1000, 3),
+        'plan': plan
+    })
+    print(f"Slow query ({elapsed * 1000:.1f} ms) in {endpoint}: {key}" + (f"\n{plan}" if plan else ''))
+
+def start_profile():
+    g.query_profile = {}
+
+def finish_profile(response):
+    profile = g.pop('query_profile', None)
+    if profile is None:
+        return response
+    
+    endpoint = current_endpoint()
+    repeated = 0
+    for key, (calls, total) in profile.items():
+        if calls > profiler.n_plus_one:
+            repeated += 1
+            profiler.flag_n_plus_one(endpoint, key, calls)
+            print(f"Possible N+1 in {request.method} {endpoint}: {calls} x {key}")
+    
+    statements = sum(calls for calls, total in profile.values())
+    db_ms = sum(total for calls, total in profile.values()) * 1000
+    response.headers['X-Query-Profile'] = (
+        f'statements={statements}; distinct={len(profile)}; db_ms={db_ms:.1f}; n_plus_one={repeated}'
+    )
+    return response
+
+def init_app(app):
+    """Profile every statement when QUERY_PROFILE is set
+    
+    Each response gets an X-Query-Profile summary; the process-wide report
+    is served by /api/dashboard/queries.
+    """
+    if not QUERY_PROFILE:
+        return
+    statement_listeners.append(on_statement)
+    app.before_request(start_profile)
+    app.after_request(finish_profile)
@@ -1,8 +1,9 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import create_access_token
-import bcrypt
-from config.database import query_db
+from config.database import query_db, commit_request_transaction
+from config.queries import USER_BY_EMAIL
 from middleware.auth import token_required, get_current_user
+from services.passwords import hash_password, verify_password, needs_rehash, PasswordPoolBusy
 
 bp = Blueprint('auth', __name__)
 
@@ -32,8 +33,10 @@ def register():
         if existing_user:
             return jsonify({'error': 'User with this email already exists'}), 400
         
-        # Hash password
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        # Hash password (in the bcrypt process pool) without holding a
+        # database connection while it queues
+        commit_request_transaction()
+        hashed_password = hash_password(password)
         
         # Create user
         query_db(
@@ -43,6 +46,8 @@ def register():
         
         return jsonify({'message': 'User registered successfully'}), 201
         
+    except PasswordPoolBusy:
+        return jsonify({'error': 'Server busy, please retry'}), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -57,21 +62,35 @@ def login():
             return jsonify({'error': 'Email and password are required'}), 400
         
         # Get user from database
-        user = query_db(
-            'SELECT id, email, password, name, role FROM users WHERE email = %s',
-            (email,),
-            fetch_one=True
-        )
+        user = query_db(USER_BY_EMAIL, (email,), fetch_one=True)
         
         if not user:
             return jsonify({'error': 'Invalid credentials'}), 401
         
-        # Verify password
-        if not bcrypt.checkpw(password.encode('utf-8'), user[2].encode('utf-8')):
+        # Verify password; the connection goes back to the pool first, so a
+        # login rush queues on bcrypt without draining the database pool
+        commit_request_transaction()
+        if not verify_password(password, user[2]):
             return jsonify({'error': 'Invalid credentials'}), 401
         
-        # Create JWT token (identity must be a string)
-        access_token = create_access_token(identity=str(user[0]))
+        # Upgrade hashes made at an outdated work factor while we have the password
+        if needs_rehash(user[2]):
+            query_db(
+                'UPDATE users SET password = %s WHERE id = %s',
+                (hash_password(password), user[0])
+            )
+        
+        # Create JWT token (identity must be a string); profile claims let
+        # protected endpoints authorize without querying the users table
+        access_token = create_access_token(
+            identity=str(user[0]),
+            additional_claims={
+                'email': user[1],
+                'name': user[3],
+                'role': user[4],
+                'ver': user[5]
+            }
+        )
         
         return jsonify({
             'token': access_token,
@@ -83,6 +102,8 @@ def login():
             }
         }), 200
         
+    except PasswordPoolBusy:
+        return jsonify({'error': 'Server busy, please retry'}), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
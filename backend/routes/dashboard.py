@@ -1,6 +1,7 @@
 from flask import Blueprint, jsonify
 from config.database import query_db
 from middleware.auth import token_required, role_required, get_current_user
+from middleware.profiler import profiler, QUERY_PROFILE
 
 bp = Blueprint('dashboard', __name__)
 
@@ -9,51 +10,71 @@ bp = Blueprint('dashboard', __name__)
 def get_stats():
     """Get dashboard statistics (admin only)"""
     try:
-        # Total equipment count
-        total_equipment = query_db(
-            'SELECT COUNT(*) FROM equipment',
-            fetch_one=True
-        )
-        
-        # Total users count
-        total_users = query_db(
-            'SELECT COUNT(*) FROM users',
-            fetch_one=True
-        )
-        
-        # Pending requests count
-        pending_requests = query_db(
-            "SELECT COUNT(*) FROM borrowing_requests WHERE status = 'pending'",
-            fetch_one=True
-        )
-        
-        # Active borrowings count
-        active_borrowings = query_db(
-            "SELECT COUNT(*) FROM borrowing_requests WHERE status = 'approved' AND CURRENT_DATE BETWEEN start_date AND end_date",
-            fetch_one=True
-        )
-        
-        # Equipment by category
-        equipment_by_category = query_db(
-            'SELECT category, COUNT(*) FROM equipment GROUP BY category',
+        # Counters are maintained by triggers; active borrowings come from
+        # today's rows of the reservation ledger. One round trip in total.
+        counters = query_db(
+            '''SELECT scope, key, value FROM stats_counters
+               UNION ALL
+               SELECT 'totals', 'active_borrowings', COALESCE(SUM(reserved), 0)
+               FROM equipment_reservations WHERE day = CURRENT_DATE''',
             fetch_all=True
         )
         
-        # Requests by status
-        requests_by_status = query_db(
-            'SELECT status, COUNT(*) FROM borrowing_requests GROUP BY status',
-            fetch_all=True
-        )
+        totals = {}
+        equipment_by_category = {}
+        requests_by_status = {}
+        for scope, key, value in counters:
+            if scope == 'totals':
+                totals[key] = value
+            elif scope == 'equipment_by_category' and value:
+                equipment_by_category[key] = value
+            elif scope == 'requests_by_status' and value:
+                requests_by_status[key] = value
         
         return jsonify({
-            'total_equipment': total_equipment[0] if total_equipment else 0,
-            'total_users': total_users[0] if total_users else 0,
-            'pending_requests': pending_requests[0] if pending_requests else 0,
-            'active_borrowings': active_borrowings[0] if active_borrowings else 0,
-            'equipment_by_category': {cat[0]: cat[1] for cat in equipment_by_category},
-            'requests_by_status': {status[0]: status[1] for status in requests_by_status}
+            'total_equipment': totals.get('equipment', 0),
+            'total_users': totals.get('users', 0),
+            'pending_requests': requests_by_status.get('pending', 0),
+            'active_borrowings': totals.get('active_borrowings', 0),
+            'equipment_by_category': equipment_by_category,
+            'requests_by_status': requests_by_status
         }), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@bp.route('/queries', methods=['GET'])
+@role_required('admin')
+def get_query_report():
+    """Query profiler report: top statements, N+1 findings, slow log (admin only)"""
+    return jsonify({'enabled': QUERY_PROFILE, **profiler.report()}), 200
+
+@bp.route('/queries', methods=['DELETE'])
+@role_required('admin')
+def reset_query_report():
+    """Clear the query profiler statistics (admin only)"""
+    profiler.reset()
+    return jsonify({'message': 'Query statistics cleared'}), 200
+
+@bp.route('/maintenance', methods=['GET'])
+@role_required('admin')
+def get_maintenance_report():
+    """Latest run of each background maintenance job (admin only)"""
+    try:
+        runs = query_db(
+            '''SELECT DISTINCT ON (job) job, started_at, duration_ms, rows_affected, error
+               FROM maintenance_runs
+               ORDER BY job, started_at DESC''',
+            fetch_all=True
+        )
+        
+        return jsonify([{
+            'job': run[0],
+            'started_at': run[1].isoformat(),
+            'duration_ms': float(run[2]),
+            'rows_affected': run[3],
+            'error': run[4]
+        } for run in runs]), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
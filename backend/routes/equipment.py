@@ -1,25 +1,68 @@
-from flask import Blueprint, request, jsonify
-from config.database import query_db
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from datetime import datetime, timedelta
+from config.database import query_db, transaction, copy_to_stream
+from config.queries import EQUIPMENT_BY_ID, EQUIPMENT_QUANTITY
 from middleware.auth import token_required, role_required
+from middleware.cache import cached_response, invalidate_cache, EQUIPMENT_CACHE
+from middleware.conditional import conditional
+from services.availability import get_available, get_availability_calendar
+from services.sync import parse_since, get_watermark, get_tombstones
+from services.equipment_io import read_rows, import_equipment
+
+# Tables whose writes can change an equipment response
+EQUIPMENT_TABLES = ('equipment', 'equipment_reservations')
+
+# Longest range served by the availability calendar (one school year plus slack)
+MAX_CALENDAR_DAYS = 400
+
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+def escape_like(value):
+    """Escape LIKE wildcards so user input matches literally"""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
 
 bp = Blueprint('equipment', __name__)
 
 @bp.route('', methods=['GET'])
 @token_required
+@conditional(*EQUIPMENT_TABLES)
+@cached_response(EQUIPMENT_CACHE)
 def get_equipment():
-    """Get all equipment with optional filters"""
+    """Get all equipment with optional filters
+    
+    With ?since=<watermark> only items changed after the watermark are
+    returned, plus the ids deleted since then and a new watermark. Delta
+    sync always covers the whole catalog, so the filters do not apply.
+    """
     try:
         category = request.args.get('category')
         search = request.args.get('search')
+        since = request.args.get('since')
         
         query = 'SELECT id, name, category, condition, quantity, description FROM equipment WHERE 1=1'
         params = []
         
+        if since:
+            try:
+                since = parse_since(since)
+            except ValueError:
+                return jsonify({'error': 'Invalid since watermark'}), 400
+            
+            watermark = get_watermark()
+            # Availability moves at midnight, so a watermark from an earlier
+            # day gets the full catalog
+            if since.date() >= datetime.now().date():
+                query += ' AND updated_at > %s'
+                params.append(since)
+            category = search = None
+        
         if category:
             query += ' AND category = %s'
             params.append(category)
         
         if search:
+            # Substring match served by the trigram indexes on name and description
             query += ' AND (name ILIKE %s OR description ILIKE %s)'
             params.extend([f'%{search}%', f'%{search}%'])
         
@@ -27,58 +70,117 @@ def get_equipment():
         
         equipment_list = query_db(query, tuple(params), fetch_all=True)
         
+        # Check availability for the whole page in a single query
+        available = get_available((item[0], item[4]) for item in equipment_list)
+        
         result = []
         for item in equipment_list:
-            # Check availability (count active borrowings)
-            active_borrowings = query_db(
-                '''SELECT COUNT(*) FROM borrowing_requests 
-                   WHERE equipment_id = %s AND status = 'approved' 
-                   AND CURRENT_DATE BETWEEN start_date AND end_date''',
-                (item[0],),
-                fetch_one=True
-            )
-            active_count = active_borrowings[0] if active_borrowings else 0
-            available = max(0, item[4] - active_count)
-            
             result.append({
                 'id': item[0],
                 'name': item[1],
                 'category': item[2],
                 'condition': item[3],
                 'quantity': item[4],
-                'available': available,
+                'available': available[item[0]],
                 'description': item[5]
             })
         
+        if since:
+            return jsonify({
+                'items': result,
+                'deleted': get_tombstones('equipment', since),
+                'watermark': watermark.isoformat()
+            }), 200
+        
         return jsonify(result), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@bp.route('/search', methods=['GET'])
+@token_required
+@conditional(*EQUIPMENT_TABLES)
+@cached_response(EQUIPMENT_CACHE)
+def search_equipment():
+    """Ranked full-text and fuzzy equipment search, or name autocomplete"""
+    try:
+        q = (request.args.get('q') or '').strip()
+        mode = request.args.get('mode', 'full')
+        
+        if not q:
+            return jsonify({'error': 'Search query is required'}), 400
+        
+        if mode not in ['full', 'autocomplete']:
+            return jsonify({'error': 'Invalid mode'}), 400
+        
+        try:
+            limit = min(int(request.args.get('limit', DEFAULT_SEARCH_LIMIT)), MAX_SEARCH_LIMIT)
+            if limit < 1:
+                raise ValueError
+        except ValueError:
+            return jsonify({'error': f'Limit must be between 1 and {MAX_SEARCH_LIMIT}'}), 400
+        
+        if mode == 'autocomplete':
+            # Prefix match served by the trigram index, closest names first
+            suggestions = query_db(
+                '''SELECT id, name, category FROM equipment
+                   WHERE name ILIKE %s
+                   ORDER BY similarity(name, %s) DESC, name
+                   LIMIT %s''',
+                (escape_like(q) + '%', q, limit),
+                fetch_all=True
+            )
+            return jsonify([
+                {'id': item[0], 'name': item[1], 'category': item[2]}
+                for item in suggestions
+            ]), 200
+        
+        # Full-text matches (GIN on search_vector) plus typo-tolerant name
+        # matches (GIN trigram), ranked together
+        equipment_list = query_db(
+            '''SELECT id, name, category, condition, quantity, description,
+                      ts_rank_cd(search_vector, query) + similarity(name, %s) AS score
+               FROM equipment, websearch_to_tsquery('english', %s) query
+               WHERE search_vector @@ query OR name %% %s
+               ORDER BY score DESC, name
+               LIMIT %s''',
+            (q, q, q, limit),
+            fetch_all=True
+        )
+        
+        available = get_available((item[0], item[4]) for item in equipment_list)
+        
+        return jsonify([
+            {
+                'id': item[0],
+                'name': item[1],
+                'category': item[2],
+                'condition': item[3],
+                'quantity': item[4],
+                'available': available[item[0]],
+                'description': item[5],
+                'score': round(float(item[6]), 4)
+            }
+            for item in equipment_list
+        ]), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @bp.route('/<int:equipment_id>', methods=['GET'])
 @token_required
+@conditional(*EQUIPMENT_TABLES)
+@cached_response(EQUIPMENT_CACHE)
 def get_equipment_by_id(equipment_id):
     """Get single equipment by ID"""
     try:
-        equipment = query_db(
-            'SELECT id, name, category, condition, quantity, description FROM equipment WHERE id = %s',
-            (equipment_id,),
-            fetch_one=True
-        )
+        equipment = query_db(EQUIPMENT_BY_ID, (equipment_id,), fetch_one=True)
         
         if not equipment:
             return jsonify({'error': 'Equipment not found'}), 404
         
         # Check availability
-        active_borrowings = query_db(
-            '''SELECT COUNT(*) FROM borrowing_requests 
-               WHERE equipment_id = %s AND status = 'approved' 
-               AND CURRENT_DATE BETWEEN start_date AND end_date''',
-            (equipment_id,),
-            fetch_one=True
-        )
-        active_count = active_borrowings[0] if active_borrowings else 0
-        available = max(0, equipment[4] - active_count)
+        available = get_available([(equipment[0], equipment[4])])[equipment[0]]
         
         return jsonify({
             'id': equipment[0],
@@ -93,6 +195,42 @@ def get_equipment_by_id(equipment_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@bp.route('/<int:equipment_id>/availability', methods=['GET'])
+@token_required
+@conditional(*EQUIPMENT_TABLES)
+@cached_response(EQUIPMENT_CACHE)
+def get_equipment_availability(equipment_id):
+    """Get free units per day for an equipment item"""
+    try:
+        try:
+            today = datetime.now().date()
+            start = datetime.strptime(request.args['from'], '%Y-%m-%d').date() if request.args.get('from') else today
+            end = datetime.strptime(request.args['to'], '%Y-%m-%d').date() if request.args.get('to') else start + timedelta(days=30)
+        except ValueError:
+            return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+        
+        if start > end:
+            return jsonify({'error': 'From date must be before or equal to to date'}), 400
+        
+        if (end - start).days >= MAX_CALENDAR_DAYS:
+            return jsonify({'error': f'Date range cannot exceed {MAX_CALENDAR_DAYS} days'}), 400
+        
+        equipment = query_db(EQUIPMENT_QUANTITY, (equipment_id,), fetch_one=True)
+        
+        if not equipment:
+            return jsonify({'error': 'Equipment not found'}), 404
+        
+        return jsonify({
+            'equipment_id': equipment[0],
+            'quantity': equipment[1],
+            'from': start.isoformat(),
+            'to': end.isoformat(),
+            'days': get_availability_calendar(equipment[0], equipment[1], start, end)
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @bp.route('', methods=['POST'])
 @role_required('admin')
 def create_equipment():
@@ -115,6 +253,7 @@ def create_equipment():
             'INSERT INTO equipment (name, category, condition, quantity, description) VALUES (%s, %s, %s, %s, %s)',
             (name, category, condition, quantity, description)
         )
+        invalidate_cache(EQUIPMENT_CACHE)
         
         return jsonify({'message': 'Equipment created successfully'}), 201
         
@@ -130,7 +269,7 @@ def update_equipment(equipment_id):
         
         # Check if equipment exists
         equipment = query_db(
-            'SELECT id FROM equipment WHERE id = %s',
+            'SELECT id FROM equipment WHERE id = %s FOR UPDATE',
             (equipment_id,),
             fetch_one=True
         )
@@ -168,6 +307,7 @@ def update_equipment(equipment_id):
         
         query = f'UPDATE equipment SET {", ".join(updates)} WHERE id = %s'
         query_db(query, tuple(params))
+        invalidate_cache(EQUIPMENT_CACHE, equipment_id)
         
         return jsonify({'message': 'Equipment updated successfully'}), 200
         
@@ -181,7 +321,7 @@ def delete_equipment(equipment_id):
     try:
         # Check if equipment exists
         equipment = query_db(
-            'SELECT id FROM equipment WHERE id = %s',
+            'SELECT id FROM equipment WHERE id = %s FOR UPDATE',
             (equipment_id,),
             fetch_one=True
         )
@@ -190,14 +330,59 @@ def delete_equipment(equipment_id):
             return jsonify({'error': 'Equipment not found'}), 404
         
         query_db('DELETE FROM equipment WHERE id = %s', (equipment_id,))
+        invalidate_cache(EQUIPMENT_CACHE, equipment_id)
         
         return jsonify({'message': 'Equipment deleted successfully'}), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@bp.route('/import', methods=['POST'])
+@role_required('admin')
+def import_equipment_file():
+    """Bulk create or update equipment from CSV or NDJSON (admin only)
+    
+    Rows with an id update that item, rows without one are created. Invalid
+    rows are reported individually and do not block the valid ones.
+    """
+    try:
+        fmt = request.args.get('format')
+        if not fmt:
+            fmt = 'ndjson' if 'json' in (request.mimetype or '') else 'csv'
+        
+        if fmt not in ['csv', 'ndjson']:
+            return jsonify({'error': 'Format must be csv or ndjson'}), 400
+        
+        with transaction() as cursor:
+            result = import_equipment(cursor, read_rows(request.stream, fmt))
+        
+        if result['inserted'] or result['updated']:
+            invalidate_cache(EQUIPMENT_CACHE)
+        
+        return jsonify(result), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/export', methods=['GET'])
+@role_required('admin')
+def export_equipment():
+    """Stream the equipment catalog as CSV (admin only)"""
+    chunks = copy_to_stream(
+        '''COPY (SELECT id, name, category, condition, quantity, description, created_at, updated_at
+                 FROM equipment ORDER BY id)
+           TO STDOUT WITH (FORMAT csv, HEADER)'''
+    )
+    return Response(
+        stream_with_context(chunks),
+        mimetype='text/csv',
+        headers={'Content-Disposition': 'attachment; filename=equipment.csv'}
+    )
+
 @bp.route('/categories', methods=['GET'])
 @token_required
+@conditional(*EQUIPMENT_TABLES)
+@cached_response(EQUIPMENT_CACHE)
 def get_categories():
     """Get all equipment categories"""
     try:
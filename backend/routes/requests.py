@@ -1,88 +1,393 @@
-from flask import Blueprint, request, jsonify
-from datetime import datetime
-from config.database import query_db
-from middleware.auth import token_required, role_required, get_current_user
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from flask_jwt_extended import get_jwt
+from datetime import datetime, timedelta
+import base64
+import binascii
+import csv
+import io
+import json
+import os
+import time
+from config.database import query_db, transaction, iter_query
+from config.queries import REQUEST_SELECT, REQUEST_BY_ID, LOCK_REQUEST, EQUIPMENT_QUANTITY
+from middleware.auth import (
+    token_required, role_required, stream_token_required, get_current_user,
+    create_stream_token, is_token_revoked, STREAM_TOKEN_TTL
+)
+from middleware.cache import invalidate_cache, EQUIPMENT_CACHE
+from middleware.conditional import conditional
+from services.sync import parse_since, get_watermark, get_tombstones
+from services.invalidation import start_listener
+from services.request_events import broker, events_since, TooManySubscribers, SSE_HEARTBEAT
+from services.ledger import (
+    lock_equipment, get_peak_reserved, reserve, release, get_reserved_days, apply_deltas
+)
 
 bp = Blueprint('requests', __name__)
 
+# Status each bulk action moves a request from and to
+BULK_ACTIONS = {
+    'approve': ('pending', 'approved'),
+    'reject': ('pending', 'rejected'),
+    'return': ('approved', 'returned')
+}
+MAX_BULK_ACTIONS = 1000
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Rows fetched per round trip by the export's server-side cursor
+EXPORT_ITERSIZE = int(os.getenv('EXPORT_ITERSIZE', 2000))
+
+# Tables joined into a request response
+REQUEST_TABLES = ('borrowing_requests', 'borrowing_requests_archive', 'users', 'equipment')
+
+def serialize_request(req):
+    """Convert a REQUEST_SELECT row to a JSON-ready dict"""
+    return {
+        'id': req[0],
+        'user_id': req[1],
+        'user_name': req[2],
+        'user_email': req[3],
+        'equipment_id': req[4],
+        'equipment_name': req[5],
+        'request_date': req[6].isoformat() if req[6] else None,
+        'start_date': req[7].isoformat() if req[7] else None,
+        'end_date': req[8].isoformat() if req[8] else None,
+        'status': req[9],
+        'approved_by': req[10],
+        'approval_date': req[11].isoformat() if req[11] else None,
+        'return_date': req[12].isoformat() if req[12] else None,
+        'overdue': req[13]
+    }
+
+def encode_cursor(request_date, request_id):
+    """Opaque pagination cursor for the last row of a page"""
+    raw = f'{request_date.isoformat()}|{request_id}'
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on malformed input"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        request_date, request_id = raw.split('|')
+        return datetime.fromisoformat(request_date), int(request_id)
+    except (UnicodeError, binascii.Error) as e:
+        raise ValueError(str(e))
+
+def stream_json_array(rows, serialize, batch_size=500):
+    """Yield a JSON array chunk by chunk"""
+    yield '['
+    first = True
+    batch = []
+    for row in rows:
+        batch.append(json.dumps(serialize(row)))
+        if len(batch) >= batch_size:
+            yield ('' if first else ',') + ','.join(batch)
+            first = False
+            batch = []
+    if batch:
+        yield ('' if first else ',') + ','.join(batch)
+    yield ']'
+
 @bp.route('', methods=['GET'])
 @token_required
+@conditional(*REQUEST_TABLES, per_user=True)
 def get_requests():
-    """Get borrowing requests (filtered by user role)"""
+    """Get borrowing requests (filtered by user role)
+    
+    With ?since=<watermark> only requests changed after the watermark are
+    returned, plus the ids deleted since then and a new watermark.
+    """
     try:
         user = get_current_user()
         status = request.args.get('status')
+        page_cursor = request.args.get('cursor')
+        limit = request.args.get('limit')
+        stream = request.args.get('stream') in ('1', 'true')
+        since = request.args.get('since')
         
-        if user['role'] == 'admin' or user['role'] == 'staff':
-            # Admin/Staff can see all requests
-            query = '''SELECT br.id, br.user_id, u.name as user_name, u.email as user_email,
-                      br.equipment_id, e.name as equipment_name, br.request_date,
-                      br.start_date, br.end_date, br.status, br.approved_by, br.approval_date, br.return_date
-                      FROM borrowing_requests br
-                      JOIN users u ON br.user_id = u.id
-                      JOIN equipment e ON br.equipment_id = e.id
-                      WHERE 1=1'''
-            params = []
-        else:
+        query = REQUEST_SELECT + ' WHERE 1=1'
+        params = []
+        
+        if user['role'] not in ['admin', 'staff']:
             # Students can only see their own requests
-            query = '''SELECT br.id, br.user_id, u.name as user_name, u.email as user_email,
-                      br.equipment_id, e.name as equipment_name, br.request_date,
-                      br.start_date, br.end_date, br.status, br.approved_by, br.approval_date, br.return_date
-                      FROM borrowing_requests br
-                      JOIN users u ON br.user_id = u.id
-                      JOIN equipment e ON br.equipment_id = e.id
-                      WHERE br.user_id = %s'''
-            params = [user['id']]
+            query += ' AND br.user_id = %s'
+            params.append(user['id'])
+        
+        if since:
+            try:
+                since = parse_since(since)
+            except ValueError:
+                return jsonify({'error': 'Invalid since watermark'}), 400
+            
+            watermark = get_watermark()
+            query += ' AND br.updated_at > %s ORDER BY br.updated_at, br.id'
+            params.append(since)
+            requests = query_db(query, tuple(params), fetch_all=True)
+            owner_id = user['id'] if user['role'] not in ['admin', 'staff'] else None
+            
+            return jsonify({
+                'items': [serialize_request(req) for req in requests],
+                'deleted': get_tombstones('borrowing_requests', since, owner_id),
+                'watermark': watermark.isoformat()
+            }), 200
         
         if status:
             query += ' AND br.status = %s'
             params.append(status)
         
-        query += ' ORDER BY br.request_date DESC'
+        if stream:
+            # Serialize straight from a server-side cursor
+            query += ' ORDER BY br.request_date DESC, br.id DESC'
+            return Response(
+                stream_with_context(stream_json_array(iter_query(query, tuple(params)), serialize_request)),
+                mimetype='application/json'
+            )
+        
+        if page_cursor is None and limit is None:
+            query += ' ORDER BY br.request_date DESC, br.id DESC'
+            requests = query_db(query, tuple(params), fetch_all=True)
+            return jsonify([serialize_request(req) for req in requests]), 200
+        
+        # Keyset pagination on (request_date, id)
+        try:
+            limit = min(int(limit or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE)
+            if limit < 1:
+                raise ValueError
+        except ValueError:
+            return jsonify({'error': f'Limit must be between 1 and {MAX_PAGE_SIZE}'}), 400
+        
+        if page_cursor:
+            try:
+                request_date, last_id = decode_cursor(page_cursor)
+            except ValueError:
+                return jsonify({'error': 'Invalid cursor'}), 400
+            query += ' AND (br.request_date, br.id) < (%s, %s)'
+            params.extend([request_date, last_id])
+        
+        query += ' ORDER BY br.request_date DESC, br.id DESC LIMIT %s'
+        params.append(limit + 1)
         
         requests = query_db(query, tuple(params), fetch_all=True)
+        page = requests[:limit]
+        next_cursor = encode_cursor(page[-1][6], page[-1][0]) if len(requests) > limit else None
+        
+        return jsonify({
+            'items': [serialize_request(req) for req in page],
+            'next_cursor': next_cursor
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+EXPORT_COLUMNS = ['id', 'user_id', 'user_name', 'user_email', 'equipment_id', 'equipment_name',
+                  'request_date', 'start_date', 'end_date', 'status', 'approved_by',
+                  'approval_date', 'return_date', 'overdue']
+
+def stream_csv(rows, serialize, batch_size=500):
+    """Yield CSV text in batches of rows, the header straight away"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    for count, row in enumerate(rows, start=1):
+        item = serialize(row)
+        writer.writerow([item[column] for column in EXPORT_COLUMNS])
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def stream_ndjson(rows, serialize, batch_size=500):
+    """Yield one JSON object per line in batches of rows"""
+    batch = []
+    for row in rows:
+        batch.append(json.dumps(serialize(row)) + '\n')
+        if len(batch) >= batch_size:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+@bp.route('/export', methods=['GET'])
+@token_required
+def export_requests():
+    """Stream borrowing history as CSV or NDJSON
+    
+    Optional filters: from/to (request date, YYYY-MM-DD, inclusive) and
+    status. Rows come from a server-side cursor, so the export runs in
+    constant memory however large the history is.
+    """
+    try:
+        user = get_current_user()
+        fmt = request.args.get('format', 'csv')
+        status = request.args.get('status')
+        
+        if fmt not in ['csv', 'ndjson']:
+            return jsonify({'error': 'Format must be csv or ndjson'}), 400
+        
+        try:
+            start = datetime.strptime(request.args['from'], '%Y-%m-%d') if request.args.get('from') else None
+            end = datetime.strptime(request.args['to'], '%Y-%m-%d') if request.args.get('to') else None
+        except ValueError:
+            return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+        
+        query = REQUEST_SELECT + ' WHERE 1=1'
+        params = []
+        
+        if user['role'] not in ['admin', 'staff']:
+            query += ' AND br.user_id = %s'
+            params.append(user['id'])
+        
+        if start:
+            query += ' AND br.request_date >= %s'
+            params.append(start)
+        
+        if end:
+            query += ' AND br.request_date < %s'
+            params.append(end + timedelta(days=1))
+        
+        if status:
+            query += ' AND br.status = %s'
+            params.append(status)
+        
+        query += ' ORDER BY br.request_date, br.id'
+        rows = iter_query(query, tuple(params), itersize=EXPORT_ITERSIZE)
+        
+        if fmt == 'csv':
+            body, mimetype = stream_csv(rows, serialize_request), 'text/csv'
+        else:
+            body, mimetype = stream_ndjson(rows, serialize_request), 'application/x-ndjson'
+        
+        return Response(
+            stream_with_context(body),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename=borrowing_history.{fmt}'}
+        )
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def format_event(event, name=None):
+    """One Server-Sent Events message"""
+    lines = []
+    if event.get('id') is not None:
+        lines.append(f"id: {event['id']}")
+    lines.append(f"event: {name or event['event']}")
+    lines.append(f'data: {json.dumps(event)}')
+    return '\n'.join(lines) + '\n\n'
+
+def reset_event():
+    # Tells the client to refetch: events were dropped or cannot be replayed
+    return format_event({'id': broker.last_id}, 'reset')
+
+def token_still_valid(claims):
+    """Whether the token a stream was opened with is unexpired and unrevoked"""
+    if claims.get('exp') is not None and claims['exp'] <= time.time():
+        return False
+    try:
+        return not is_token_revoked(claims)
+    except Exception:
+        # Database unavailable: keep the stream and check again next heartbeat
+        return True
+
+def stream_events(subscription, replay, claims):
+    yield 'retry: 3000\n\n'
+    if replay is None:
+        yield reset_event()
+        replay = []
+    for event in replay:
+        yield format_event(event)
+    replayed = {event['id'] for event in replay}
+    next_check = time.monotonic() + SSE_HEARTBEAT
+    
+    while True:
+        event = subscription.get(SSE_HEARTBEAT)
+        if time.monotonic() >= next_check:
+            if not token_still_valid(claims):
+                # The client reconnects with a fresh token, or is signed out
+                return
+            next_check = time.monotonic() + SSE_HEARTBEAT
+        if subscription.overflowed:
+            # Queued events predate the refetch the reset asks for; anything
+            # offered after the drain is newer and still delivered
+            subscription.overflowed = False
+            subscription.drain()
+            yield reset_event()
+            continue
+        if event is None:
+            # Comment line; also how a closed connection gets noticed
+            yield ': keep-alive\n\n'
+        elif event['id'] not in replayed:
+            yield format_event(event)
+
+@bp.route('/stream/token', methods=['POST'])
+@token_required
+def get_stream_token():
+    """Short-lived token for opening the event stream as ?token="""
+    return jsonify({'token': create_stream_token(), 'expires_in': STREAM_TOKEN_TTL}), 200
+
+@bp.route('/stream', methods=['GET'])
+@stream_token_required
+def stream_request_events():
+    """Server-Sent Events feed of created requests and status changes
+    
+    Students receive events for their own requests only. Send Last-Event-ID
+    (browsers do on reconnect) or ?last_event_id= to replay what was missed.
+    Events come from this worker's one LISTEN connection, so an open stream
+    holds no database connection, but it does hold a server thread. The
+    stream ends once its token expires or is revoked.
+    """
+    try:
+        user = get_current_user()
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        
+        if last_event_id is not None:
+            try:
+                last_event_id = int(last_event_id)
+            except ValueError:
+                return jsonify({'error': 'Invalid Last-Event-ID'}), 400
         
-        result = []
-        for req in requests:
-            result.append({
-                'id': req[0],
-                'user_id': req[1],
-                'user_name': req[2],
-                'user_email': req[3],
-                'equipment_id': req[4],
-                'equipment_name': req[5],
-                'request_date': req[6].isoformat() if req[6] else None,
-                'start_date': req[7].isoformat() if req[7] else None,
-                'end_date': req[8].isoformat() if req[8] else None,
-                'status': req[9],
-                'approved_by': req[10],
-                'approval_date': req[11].isoformat() if req[11] else None,
-                'return_date': req[12].isoformat() if req[12] else None
-            })
-        
-        return jsonify(result), 200
+        start_listener()
+        owner_id = user['id'] if user['role'] not in ['admin', 'staff'] else None
+        
+        # Subscribe before reading the backlog so nothing falls in between
+        try:
+            subscription = broker.subscribe(owner_id)
+        except TooManySubscribers:
+            return jsonify({'error': 'Too many open streams, please retry'}), 503, {'Retry-After': '5'}
+        
+        try:
+            replay = events_since(last_event_id, owner_id) if last_event_id is not None else []
+        except Exception:
+            broker.unsubscribe(subscription)
+            raise
+        
+        response = Response(
+            stream_events(subscription, replay, get_jwt()),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+        # Runs when the client goes away, even before the first byte was sent
+        response.call_on_close(lambda: broker.unsubscribe(subscription))
+        return response
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @bp.route('/<int:request_id>', methods=['GET'])
 @token_required
+@conditional(*REQUEST_TABLES, per_user=True)
 def get_request_by_id(request_id):
     """Get single request by ID"""
     try:
         user = get_current_user()
         
-        request_data = query_db(
-            '''SELECT br.id, br.user_id, u.name as user_name, u.email as user_email,
-               br.equipment_id, e.name as equipment_name, br.request_date,
-               br.start_date, br.end_date, br.status, br.approved_by, br.approval_date, br.return_date
-               FROM borrowing_requests br
-               JOIN users u ON br.user_id = u.id
-               JOIN equipment e ON br.equipment_id = e.id
-               WHERE br.id = %s''',
-            (request_id,),
-            fetch_one=True
-        )
+        request_data = query_db(REQUEST_BY_ID, (request_id,), fetch_one=True)
         
         if not request_data:
             return jsonify({'error': 'Request not found'}), 404
@@ -91,21 +396,7 @@ def get_request_by_id(request_id):
         if user['role'] not in ['admin', 'staff'] and request_data[1] != user['id']:
             return jsonify({'error': 'Unauthorized'}), 403
         
-        return jsonify({
-            'id': request_data[0],
-            'user_id': request_data[1],
-            'user_name': request_data[2],
-            'user_email': request_data[3],
-            'equipment_id': request_data[4],
-            'equipment_name': request_data[5],
-            'request_date': request_data[6].isoformat() if request_data[6] else None,
-            'start_date': request_data[7].isoformat() if request_data[7] else None,
-            'end_date': request_data[8].isoformat() if request_data[8] else None,
-            'status': request_data[9],
-            'approved_by': request_data[10],
-            'approval_date': request_data[11].isoformat() if request_data[11] else None,
-            'return_date': request_data[12].isoformat() if request_data[12] else None
-        }), 200
+        return jsonify(serialize_request(request_data)), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -139,40 +430,14 @@ def create_request():
             return jsonify({'error': 'Start date cannot be in the past'}), 400
         
         # Check if equipment exists
-        equipment = query_db(
-            'SELECT id, quantity FROM equipment WHERE id = %s',
-            (equipment_id,),
-            fetch_one=True
-        )
+        equipment = query_db(EQUIPMENT_QUANTITY, (equipment_id,), fetch_one=True)
         
         if not equipment:
             return jsonify({'error': 'Equipment not found'}), 404
         
-        # Check for overlapping bookings
-        overlapping = query_db(
-            '''SELECT COUNT(*) FROM borrowing_requests
-               WHERE equipment_id = %s AND status = 'approved'
-               AND ((start_date <= %s AND end_date >= %s)
-               OR (start_date <= %s AND end_date >= %s)
-               OR (start_date >= %s AND end_date <= %s))''',
-            (equipment_id, start, start, end, end, start, end),
-            fetch_one=True
-        )
-        
-        if overlapping and overlapping[0] > 0:
-            # Check if there's available quantity
-            active_count = query_db(
-                '''SELECT COUNT(*) FROM borrowing_requests
-                   WHERE equipment_id = %s AND status = 'approved'
-                   AND ((start_date <= %s AND end_date >= %s)
-                   OR (start_date <= %s AND end_date >= %s)
-                   OR (start_date >= %s AND end_date <= %s))''',
-                (equipment_id, start, start, end, end, start, end),
-                fetch_one=True
-            )
-            
-            if active_count and active_count[0] >= equipment[1]:
-                return jsonify({'error': 'Equipment not available for the selected dates'}), 400
+        # Check capacity against the reservation ledger
+        if get_peak_reserved(equipment_id, start, end) >= equipment[1]:
+            return jsonify({'error': 'Equipment not available for the selected dates'}), 400
         
         # Create request
         query_db(
@@ -192,48 +457,38 @@ def approve_request(request_id):
     try:
         user = get_current_user()
         
-        # Get request
-        request_data = query_db(
-            'SELECT id, equipment_id, start_date, end_date, status FROM borrowing_requests WHERE id = %s',
-            (request_id,),
-            fetch_one=True
-        )
-        
-        if not request_data:
-            return jsonify({'error': 'Request not found'}), 404
-        
-        if request_data[4] != 'pending':
-            return jsonify({'error': 'Request is not pending'}), 400
-        
-        # Check for overlapping bookings
-        equipment = query_db(
-            'SELECT quantity FROM equipment WHERE id = %s',
-            (request_data[1],),
-            fetch_one=True
-        )
-        
-        if equipment:
-            overlapping = query_db(
-                '''SELECT COUNT(*) FROM borrowing_requests
-                   WHERE equipment_id = %s AND status = 'approved' AND id != %s
-                   AND ((start_date <= %s AND end_date >= %s)
-                   OR (start_date <= %s AND end_date >= %s)
-                   OR (start_date >= %s AND end_date <= %s))''',
-                (request_data[1], request_id, request_data[2], request_data[2],
-                 request_data[3], request_data[3], request_data[2], request_data[3]),
-                fetch_one=True
-            )
+        with transaction() as cursor:
+            # Lock the request so it cannot be approved twice
+            LOCK_REQUEST.execute(cursor, (request_id,))
+            request_data = cursor.fetchone()
+            
+            if not request_data:
+                return jsonify({'error': 'Request not found'}), 404
             
-            if overlapping and overlapping[0] >= equipment[0]:
+            if request_data[4] != 'pending':
+                return jsonify({'error': 'Request is not pending'}), 400
+            
+            # Lock the equipment so parallel approvals see each other's reservations
+            quantity = lock_equipment(cursor, request_data[1])
+            
+            if quantity is None:
+                return jsonify({'error': 'Equipment not found'}), 404
+            
+            if get_peak_reserved(request_data[1], request_data[2], request_data[3], cursor) >= quantity:
                 return jsonify({'error': 'Cannot approve: Equipment not available for the selected dates'}), 400
+            
+            # Approve request and reserve its days in the same transaction
+            reserve(cursor, request_data[1], request_data[2], request_data[3])
+            cursor.execute(
+                '''UPDATE borrowing_requests 
+                   SET status = 'approved', approved_by = %s, approval_date = CURRENT_TIMESTAMP,
+                       updated_at = CURRENT_TIMESTAMP
+                   WHERE id = %s''',
+                (user['id'], request_id)
+            )
         
-        # Approve request
-        query_db(
-            '''UPDATE borrowing_requests 
-               SET status = 'approved', approved_by = %s, approval_date = CURRENT_TIMESTAMP
-               WHERE id = %s''',
-            (user['id'], request_id)
-        )
+        # Availability shown in the equipment catalog has changed
+        invalidate_cache(EQUIPMENT_CACHE, request_data[1])
         
         return jsonify({'message': 'Request approved successfully'}), 200
         
@@ -249,7 +504,7 @@ def reject_request(request_id):
         
         # Get request
         request_data = query_db(
-            'SELECT id, status FROM borrowing_requests WHERE id = %s',
+            'SELECT id, status FROM borrowing_requests WHERE id = %s FOR UPDATE',
             (request_id,),
             fetch_one=True
         )
@@ -263,7 +518,8 @@ def reject_request(request_id):
         # Reject request
         query_db(
             '''UPDATE borrowing_requests 
-               SET status = 'rejected', approved_by = %s, approval_date = CURRENT_TIMESTAMP
+               SET status = 'rejected', approved_by = %s, approval_date = CURRENT_TIMESTAMP,
+                   updated_at = CURRENT_TIMESTAMP
                WHERE id = %s''',
             (user['id'], request_id)
         )
@@ -278,29 +534,153 @@ def reject_request(request_id):
 def mark_returned(request_id):
     """Mark equipment as returned (staff/admin only)"""
     try:
-        # Get request
-        request_data = query_db(
-            'SELECT id, status FROM borrowing_requests WHERE id = %s',
-            (request_id,),
-            fetch_one=True
-        )
-        
-        if not request_data:
-            return jsonify({'error': 'Request not found'}), 404
-        
-        if request_data[1] != 'approved':
-            return jsonify({'error': 'Only approved requests can be marked as returned'}), 400
+        with transaction() as cursor:
+            LOCK_REQUEST.execute(cursor, (request_id,))
+            request_data = cursor.fetchone()
+            
+            if not request_data:
+                return jsonify({'error': 'Request not found'}), 404
+            
+            if request_data[4] != 'approved':
+                return jsonify({'error': 'Only approved requests can be marked as returned'}), 400
+            
+            # Mark as returned and free its reserved days
+            lock_equipment(cursor, request_data[1])
+            release(cursor, request_data[1], request_data[2], request_data[3])
+            cursor.execute(
+                '''UPDATE borrowing_requests 
+                   SET status = 'returned', return_date = CURRENT_TIMESTAMP,
+                       updated_at = CURRENT_TIMESTAMP
+                   WHERE id = %s''',
+                (request_id,)
+            )
         
-        # Mark as returned
-        query_db(
-            '''UPDATE borrowing_requests 
-               SET status = 'returned', return_date = CURRENT_TIMESTAMP
-               WHERE id = %s''',
-            (request_id,)
-        )
+        invalidate_cache(EQUIPMENT_CACHE, request_data[1])
         
         return jsonify({'message': 'Equipment marked as returned successfully'}), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+
+@bp.route('/bulk', methods=['POST'])
+@role_required('admin', 'staff')
+def bulk_update_requests():
+    """Approve, reject or return many requests in one transaction (staff/admin only)"""
+    try:
+        user = get_current_user()
+        data = request.get_json()
+        items = data.get('actions') if isinstance(data, dict) else data
+        
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'A non-empty list of {id, action} is required'}), 400
+        
+        if len(items) > MAX_BULK_ACTIONS:
+            return jsonify({'error': f'At most {MAX_BULK_ACTIONS} actions per call'}), 400
+        
+        for item in items:
+            # bool is a subclass of int, so true/false would pass for an id
+            if not isinstance(item, dict) or not isinstance(item.get('id'), int) \
+                    or isinstance(item.get('id'), bool) or item.get('action') not in BULK_ACTIONS:
+                return jsonify({'error': 'Each item needs an integer id and an action of approve, reject or return'}), 400
+        
+        # Results are keyed by position; repeated ids are rejected up front
+        results = {}
+        first_seen = {}
+        for index, item in enumerate(items):
+            if item['id'] in first_seen:
+                results[index] = 'Duplicate request id'
+            else:
+                first_seen[item['id']] = index
+        ids = sorted(first_seen)
+        
+        with transaction() as cursor:
+            # Lock every affected request, then every affected equipment row,
+            # always in id order so concurrent bulk calls cannot deadlock
+            cursor.execute(
+                '''SELECT id, equipment_id, start_date, end_date, status FROM borrowing_requests
+                   WHERE id = ANY(%s) ORDER BY id FOR UPDATE''',
+                (ids,)
+            )
+            rows = {row[0]: row for row in cursor.fetchall()}
+            
+            cursor.execute(
+                '''SELECT id, quantity FROM equipment
+                   WHERE id = ANY(%s) ORDER BY id FOR UPDATE''',
+                (sorted({row[1] for row in rows.values()}),)
+            )
+            quantities = dict(cursor.fetchall())
+            
+            ranges = {}
+            for row in rows.values():
+                start, end = ranges.get(row[1], (row[2], row[3]))
+                ranges[row[1]] = (min(start, row[2]), max(end, row[3]))
+            reserved = get_reserved_days(cursor, ranges)
+            
+            # Validate against each other in memory; returns go first so the
+            # capacity they free is available to approvals in the same batch
+            deltas = {}
+            changes = []
+            ordered = sorted(first_seen.values(), key=lambda index: items[index]['action'] != 'return')
+            for index in ordered:
+                request_id, action = items[index]['id'], items[index]['action']
+                row = rows.get(request_id)
+                from_status, to_status = BULK_ACTIONS[action]
+                
+                if not row:
+                    results[index] = 'Request not found'
+                    continue
+                
+                if row[4] != from_status:
+                    results[index] = f'Request is not {from_status}'
+                    continue
+                
+                days = [row[2] + timedelta(days=i) for i in range((row[3] - row[2]).days + 1)]
+                if action == 'approve':
+                    quantity = quantities.get(row[1], 0)
+                    if any(reserved.get((row[1], day), 0) + 1 > quantity for day in days):
+                        results[index] = 'Equipment not available for the selected dates'
+                        continue
+                
+                if action in ('approve', 'return'):
+                    step = 1 if action == 'approve' else -1
+                    for day in days:
+                        reserved[(row[1], day)] = reserved.get((row[1], day), 0) + step
+                        deltas[(row[1], day)] = deltas.get((row[1], day), 0) + step
+                
+                changes.append((request_id, to_status))
+                results[index] = None
+            
+            # Apply every status change and ledger update together
+            apply_deltas(cursor, deltas)
+            if changes:
+                cursor.execute(
+                    '''UPDATE borrowing_requests br
+                       SET status = c.status,
+                           approved_by = CASE WHEN c.status = 'returned' THEN br.approved_by ELSE %s END,
+                           approval_date = CASE WHEN c.status = 'returned' THEN br.approval_date ELSE CURRENT_TIMESTAMP END,
+                           return_date = CASE WHEN c.status = 'returned' THEN CURRENT_TIMESTAMP ELSE br.return_date END,
+                           updated_at = CURRENT_TIMESTAMP
+                       FROM unnest(%s::int[], %s::text[]) AS c(id, status)
+                       WHERE br.id = c.id''',
+                    (user['id'], [c[0] for c in changes], [c[1] for c in changes])
+                )
+        
+        if deltas:
+            invalidate_cache(EQUIPMENT_CACHE)
+        
+        response = []
+        for index, item in enumerate(items):
+            entry = {'id': item['id'], 'action': item['action'], 'success': results[index] is None}
+            if results[index]:
+                entry['error'] = results[index]
+            response.append(entry)
+        
+        return jsonify({
+            'results': response,
+            'succeeded': sum(1 for entry in response if entry['success']),
+            'failed': sum(1 for entry in response if not entry['success'])
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
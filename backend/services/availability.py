@@ -0,0 +1,60 @@
+from datetime import timedelta
+from config.database import query_db
+from config.queries import ACTIVE_COUNTS
+
+def get_active_counts(equipment_ids):
+    """Count today's approved borrowings for a set of equipment ids in one query"""
+    ids = list(equipment_ids)
+    if not ids:
+        return {}
+    
+    rows = query_db(ACTIVE_COUNTS, (ids,), fetch_all=True)
+    return {row[0]: row[1] for row in rows}
+
+def get_available(equipment_rows):
+    """Map equipment id -> available units for (id, quantity) pairs"""
+    rows = list(equipment_rows)
+    active = get_active_counts(row[0] for row in rows)
+    return {row[0]: max(0, row[1] - active.get(row[0], 0)) for row in rows}
+
+def get_approved_intervals(equipment_id, range_start, range_end):
+    """Fetch approved booking intervals overlapping [range_start, range_end]"""
+    return query_db(
+        '''SELECT start_date, end_date FROM borrowing_requests
+           WHERE equipment_id = %s AND status = 'approved'
+           AND start_date <= %s AND end_date >= %s''',
+        (equipment_id, range_end, range_start),
+        fetch_all=True
+    )
+
+def sweep_daily_usage(intervals, range_start, range_end):
+    """Count concurrent bookings per day with a sorted sweep over interval edges"""
+    events = []
+    for start, end in intervals:
+        events.append((max(start, range_start), 1))
+        events.append((min(end, range_end) + timedelta(days=1), -1))
+    events.sort()
+    
+    usage = []
+    active = 0
+    i = 0
+    day = range_start
+    while day <= range_end:
+        while i < len(events) and events[i][0] <= day:
+            active += events[i][1]
+            i += 1
+        usage.append((day, active))
+        day += timedelta(days=1)
+    return usage
+
+def get_availability_calendar(equipment_id, quantity, range_start, range_end):
+    """Free units per day for one equipment item"""
+    intervals = get_approved_intervals(equipment_id, range_start, range_end)
+    return [
+        {
+            'date': day.isoformat(),
+            'booked': booked,
+            'available': max(0, quantity - booked)
+        }
+        for day, booked in sweep_daily_usage(intervals, range_start, range_end)
+    ]
@@ -0,0 +1,133 @@
+import threading
+import time
+from collections import OrderedDict
+
+class TTLCache:
+    """Thread-safe in-process cache whose entries expire after ttl seconds"""
+    
+    def __init__(self, ttl, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            return value
+    
+    def set(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            # Oldest entries are evicted first once the cache is full
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+    
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+class LRUCache:
+    """Thread-safe LRU cache bounded by entry count and total size in bytes.
+    
+    Keys are (namespace, ...) tuples so a whole namespace can be dropped at
+    once when the data behind it changes. Entries also expire after ttl
+    seconds (None to disable).
+    """
+    
+    def __init__(self, max_entries=1000, max_bytes=32 * 1024 * 1024, ttl=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data = OrderedDict()    # key -> (value, size, expires_at)
+        self._namespaces = {}         # namespace -> set of keys
+        self._bytes = 0
+        self._generations = {}        # namespace -> times invalidated
+        self._epoch = 0               # times cleared
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or (entry[2] is not None and entry[2] < time.monotonic()):
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+    
+    def generation(self, namespace):
+        """Token that changes whenever namespace is invalidated or the cache cleared"""
+        with self._lock:
+            return (self._epoch, self._generations.get(namespace, 0))
+    
+    def set(self, key, value, size, generation=None):
+        """Store value; with generation (read before computing value), skip the
+        store if the namespace was invalidated in between, since value may
+        have been built from data that was already stale"""
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if generation is not None and generation != (self._epoch, self._generations.get(key[0], 0)):
+                return
+            if key in self._data:
+                self._remove(key)
+            expires_at = time.monotonic() + self.ttl if self.ttl else None
+            self._data[key] = (value, size, expires_at)
+            self._namespaces.setdefault(key[0], set()).add(key)
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+    
+    def invalidate(self, namespace):
+        """Drop every entry in a namespace"""
+        with self._lock:
+            for key in list(self._namespaces.get(namespace, ())):
+                self._remove(key)
+            self._generations[namespace] = self._generations.get(namespace, 0) + 1
+            self.invalidations += 1
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._namespaces.clear()
+            self._bytes = 0
+            self._epoch += 1
+    
+    def _remove(self, key):
+        _, size, _ = self._data.pop(key)
+        self._bytes -= size
+        keys = self._namespaces.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._namespaces[key[0]]
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
@@ -0,0 +1,147 @@
+import csv
+import io
+import json
+import tempfile
+
+CONDITIONS = ['excellent', 'good', 'fair', 'poor']
+IMPORT_COLUMNS = ['line', 'id', 'name', 'category', 'condition', 'quantity', 'description']
+# Only the first errors are reported row by row; the rest are counted
+MAX_REPORTED_ERRORS = 1000
+
+def read_rows(stream, fmt):
+    """Yield (line_number, dict) from a CSV (with header) or NDJSON upload"""
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line_number, None
+            continue
+        yield line_number, row if isinstance(row, dict) else None
+
+def validate_row(row):
+    """Return (clean_row, None) or (None, error message)"""
+    if row is None:
+        return None, 'Row is not a valid JSON object'
+    
+    name = str(row.get('name') or '').strip()
+    category = str(row.get('category') or '').strip()
+    condition = str(row.get('condition') or '').strip()
+    description = row.get('description') or ''
+    
+    if not name or not category or not condition:
+        return None, 'Name, category, and condition are required'
+    if len(name) > 255 or len(category) > 100:
+        return None, 'Name or category is too long'
+    if condition not in CONDITIONS:
+        return None, 'Invalid condition'
+    
+    try:
+        quantity = int(row['quantity']) if row.get('quantity') not in (None, '') else 1
+        equipment_id = int(row['id']) if row.get('id') not in (None, '') else None
+    except (TypeError, ValueError):
+        return None, 'Quantity and id must be integers'
+    if quantity < 0:
+        return None, 'Quantity cannot be negative'
+    
+    return {
+        'id': equipment_id,
+        'name': name,
+        'category': category,
+        'condition': condition,
+        'quantity': quantity,
+        'description': str(description)
+    }, None
+
+def import_equipment(cursor, rows):
+    """Validate rows in one streaming pass, COPY the valid ones into a staging
+    table and merge them into equipment with a single statement.
+    
+    Rows with an id update that item; rows without one are inserted.
+    """
+    errors = []
+    error_count = 0
+    id_lines = {}
+    
+    def add_error(line, message):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({'row': line, 'error': message})
+    
+    # Valid rows are spooled to disk past 8MB so memory stays bounded
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024, mode='w+', newline='') as buffer:
+        writer = csv.writer(buffer)
+        staged = 0
+        for line, raw in rows:
+            row, error = validate_row(raw)
+            if error:
+                add_error(line, error)
+                continue
+            if row['id'] is not None:
+                if row['id'] in id_lines:
+                    add_error(line, f"Duplicate id {row['id']} (also on row {id_lines[row['id']]})")
+                    continue
+                id_lines[row['id']] = line
+            writer.writerow([line, row['id'], row['name'], row['category'],
+                             row['condition'], row['quantity'], row['description']])
+            staged += 1
+        
+        if not staged:
+            return {'inserted': 0, 'updated': 0, 'errors': errors, 'error_count': error_count}
+        
+        buffer.seek(0)
+        cursor.execute(
+            '''CREATE TEMP TABLE equipment_import (
+                 line INTEGER,
+                 id INTEGER,
+                 name VARCHAR(255),
+                 category VARCHAR(100),
+                 condition VARCHAR(50),
+                 quantity INTEGER,
+                 description TEXT
+               ) ON COMMIT DROP'''
+        )
+        cursor.copy_expert(
+            f"COPY equipment_import ({', '.join(IMPORT_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+    
+    cursor.execute(
+        '''WITH updated AS (
+             UPDATE equipment e
+             SET name = s.name, category = s.category, condition = s.condition,
+                 quantity = s.quantity, description = s.description,
+                 updated_at = CURRENT_TIMESTAMP
+             FROM equipment_import s
+             WHERE s.id IS NOT NULL AND e.id = s.id
+             RETURNING s.id
+           ), inserted AS (
+             INSERT INTO equipment (name, category, condition, quantity, description)
+             SELECT name, category, condition, quantity, description
+             FROM equipment_import WHERE id IS NULL ORDER BY line
+             RETURNING 1
+           )
+           SELECT (SELECT COUNT(*) FROM inserted),
+                  (SELECT COALESCE(array_agg(id), '{}') FROM updated)'''
+    )
+    inserted, updated_ids = cursor.fetchone()
+    
+    for equipment_id in set(id_lines) - set(updated_ids):
+        add_error(id_lines[equipment_id], f'Equipment {equipment_id} not found')
+    errors.sort(key=lambda error: error['row'])
+    
+    return {
+        'inserted': inserted,
+        'updated': len(updated_ids),
+        'errors': errors,
+        'error_count': error_count
+    }
@@ -0,0 +1,147 @@
+import json
+import os
+import select
+import threading
+import uuid
+import psycopg2
+from config.database import query_db, open_dedicated_connection
+
+# Postgres channel carrying {"t": table, "id": row id or null, "v": version, "o": origin}
+CHANNEL = 'cache_invalidation'
+
+# Identifies this worker so it can skip its own messages (it already
+# invalidated locally when the transaction committed)
+ORIGIN = uuid.uuid4().hex[:12]
+
+handlers = {}
+
+# Other channels delivered over the same connection:
+# channel -> (handler(payload), on_connect(conn) or None)
+channels = {}
+
+def subscribe(table, handler):
+    """Call handler(row_id) when another worker invalidates table
+    
+    row_id is None when the whole table should be treated as changed,
+    including after the listener reconnects and may have missed messages.
+    """
+    handlers.setdefault(table, []).append(handler)
+
+def listen(channel, handler, on_connect=None):
+    """Call handler(payload) for every notification on channel
+    
+    on_connect(conn) runs on the listening connection after every (re)connect,
+    once LISTEN is in place, to catch up on anything missed while away.
+    Register before the listener starts.
+    """
+    channels[channel] = (handler, on_connect)
+
+def publish(table, row_id=None):
+    """Queue an invalidation message in the current transaction
+    
+    NOTIFY is transactional: listeners only see it once the write commits,
+    and never if it rolls back.
+    """
+    query_db(
+        '''SELECT pg_notify(%s, json_build_object(
+               't', %s::text,
+               'id', %s::int,
+               'v', COALESCE((SELECT version FROM table_versions WHERE name = %s), 0),
+               'o', %s::text)::text)''',
+        (CHANNEL, table, row_id, table, ORIGIN)
+    )
+
+def dispatch(payload):
+    try:
+        message = json.loads(payload)
+        table = message['t']
+    except (ValueError, KeyError, TypeError):
+        return
+    if message.get('o') == ORIGIN:
+        return
+    for handler in handlers.get(table, []):
+        handler(message.get('id'))
+
+def flush_all():
+    for table_handlers in handlers.values():
+        for handler in table_handlers:
+            handler(None)
+
+def deliver(notify):
+    """Hand one notification to its channel's handler
+    
+    A failing handler is logged and skipped; letting it raise would end
+    the listener thread and with it every later invalidation.
+    """
+    try:
+        if notify.channel == CHANNEL:
+            dispatch(notify.payload)
+        elif notify.channel in channels:
+            channels[notify.channel][0](notify.payload)
+    except Exception as e:
+        print(f"Notification handler for {notify.channel} failed: {e!r}")
+
+class InvalidationListener(threading.Thread):
+    """LISTENs on a dedicated connection and applies invalidations locally
+    
+    Channels registered with listen() share the connection.
+    """
+    
+    def __init__(self, poll_timeout=5, max_backoff=30):
+        super().__init__(name='cache-invalidation', daemon=True)
+        self.poll_timeout = poll_timeout
+        self.max_backoff = max_backoff
+        self.stopped = threading.Event()
+    
+    def run(self):
+        backoff = 1
+        while not self.stopped.is_set():
+            conn = None
+            try:
+                conn = open_dedicated_connection()
+                for channel in [CHANNEL, *channels]:
+                    conn.cursor().execute(f'LISTEN {channel}')
+                # Anything sent while we were not listening is lost
+                try:
+                    flush_all()
+                except Exception as e:
+                    print(f"Cache flush after reconnect failed: {e!r}")
+                for handler, on_connect in channels.values():
+                    if on_connect is not None:
+                        on_connect(conn)
+                backoff = 1
+                while not self.stopped.is_set():
+                    if select.select([conn], [], [], self.poll_timeout) == ([], [], []):
+                        # Quiet channel: make sure the connection is still alive
+                        conn.cursor().execute('SELECT 1')
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        deliver(conn.notifies.pop(0))
+            except (psycopg2.Error, OSError) as e:
+                print(f"Notification listener disconnected: {e}")
+            except Exception as e:
+                # Never let the thread die; reconnect after the backoff
+                print(f"Notification listener failed: {e!r}")
+            finally:
+                if conn is not None:
+                    conn.close()
+            self.stopped.wait(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+    
+    def stop(self):
+        self.stopped.set()
+
+listener = None
+_listener_lock = threading.Lock()
+
+def start_listener():
+    """Start this worker's listener thread once"""
+    global listener
+    if listener is not None:
+        return listener
+    with _listener_lock:
+        if listener is None:
+            listener = InvalidationListener()
+            listener.start()
+    return listener
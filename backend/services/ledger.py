@@ -0,0 +1,87 @@
+from config.database import query_db
+from config.queries import LOCK_EQUIPMENT, PEAK_RESERVED
+
+# The reservation ledger keeps one row per (equipment, day) holding the number
+# of approved bookings covering that day. Writers lock the equipment row first,
+# so concurrent approvals and returns for the same item are serialized and the
+# capacity check plus ledger update happen atomically. Every ledger write also
+# touches equipment.updated_at so delta sync picks up the availability change.
+
+def lock_equipment(cursor, equipment_id):
+    """Lock an equipment row for the rest of the transaction and return its quantity"""
+    LOCK_EQUIPMENT.execute(cursor, (equipment_id,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def get_peak_reserved(equipment_id, start_date, end_date, cursor=None):
+    """Highest number of units reserved on any day in the range"""
+    params = (equipment_id, start_date, end_date)
+    if cursor is None:
+        return query_db(PEAK_RESERVED, params, fetch_one=True)[0]
+    PEAK_RESERVED.execute(cursor, params)
+    return cursor.fetchone()[0]
+
+def reserve(cursor, equipment_id, start_date, end_date):
+    """Add one unit to every day of the range"""
+    cursor.execute(
+        '''WITH touched AS (
+               UPDATE equipment SET updated_at = CURRENT_TIMESTAMP WHERE id = %s
+           )
+           INSERT INTO equipment_reservations (equipment_id, day, reserved)
+           SELECT %s, d::date, 1 FROM generate_series(%s::date, %s::date, interval '1 day') d
+           ON CONFLICT (equipment_id, day)
+           DO UPDATE SET reserved = equipment_reservations.reserved + 1''',
+        (equipment_id, equipment_id, start_date, end_date)
+    )
+
+def release(cursor, equipment_id, start_date, end_date):
+    """Remove one unit from every day of the range"""
+    cursor.execute(
+        '''WITH touched AS (
+               UPDATE equipment SET updated_at = CURRENT_TIMESTAMP WHERE id = %s
+           )
+           UPDATE equipment_reservations SET reserved = reserved - 1
+           WHERE equipment_id = %s AND day BETWEEN %s AND %s''',
+        (equipment_id, equipment_id, start_date, end_date)
+    )
+
+def get_reserved_days(cursor, ranges):
+    """Load ledger rows for {equipment_id: (start_date, end_date)} in one query"""
+    if not ranges:
+        return {}
+    ids = list(ranges)
+    cursor.execute(
+        '''SELECT r.equipment_id, r.day, r.reserved FROM equipment_reservations r
+           JOIN unnest(%s::int[], %s::date[], %s::date[]) AS q(equipment_id, start_date, end_date)
+           ON r.equipment_id = q.equipment_id AND r.day BETWEEN q.start_date AND q.end_date''',
+        (ids, [ranges[i][0] for i in ids], [ranges[i][1] for i in ids])
+    )
+    return {(row[0], row[1]): row[2] for row in cursor.fetchall()}
+
+def apply_deltas(cursor, deltas):
+    """Write net {(equipment_id, day): delta} changes back to the ledger"""
+    added = [(key, delta) for key, delta in deltas.items() if delta > 0]
+    removed = [(key, delta) for key, delta in deltas.items() if delta < 0]
+    
+    if added:
+        cursor.execute(
+            '''INSERT INTO equipment_reservations (equipment_id, day, reserved)
+               SELECT * FROM unnest(%s::int[], %s::date[], %s::int[])
+               ON CONFLICT (equipment_id, day)
+               DO UPDATE SET reserved = equipment_reservations.reserved + EXCLUDED.reserved''',
+            ([k[0] for k, _ in added], [k[1] for k, _ in added], [d for _, d in added])
+        )
+    
+    if removed:
+        cursor.execute(
+            '''UPDATE equipment_reservations r SET reserved = r.reserved + q.delta
+               FROM unnest(%s::int[], %s::date[], %s::int[]) AS q(equipment_id, day, delta)
+               WHERE r.equipment_id = q.equipment_id AND r.day = q.day''',
+            ([k[0] for k, _ in removed], [k[1] for k, _ in removed], [d for _, d in removed])
+        )
+    
+    if deltas:
+        cursor.execute(
+            'UPDATE equipment SET updated_at = CURRENT_TIMESTAMP WHERE id = ANY(%s)',
+            (sorted({key[0] for key in deltas}),)
+        )
@@ -0,0 +1,288 @@
+import argparse
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+import psycopg2
+from config.database import open_dedicated_connection
+
+# Set to 0 on web workers when maintenance runs as its own process
+MAINTENANCE_ENABLED = os.getenv('MAINTENANCE_ENABLED', '1').lower() in ('1', 'true', 'yes')
+MAINTENANCE_BATCH_SIZE = int(os.getenv('MAINTENANCE_BATCH_SIZE', 500))
+MAINTENANCE_MAX_BATCHES = int(os.getenv('MAINTENANCE_MAX_BATCHES', 100))
+MAINTENANCE_INTERVAL = float(os.getenv('MAINTENANCE_INTERVAL', 300))
+# How often the leader checks its schedule and followers retry the lock
+MAINTENANCE_TICK = float(os.getenv('MAINTENANCE_TICK', 30))
+MAINTENANCE_HISTORY_DAYS = int(os.getenv('MAINTENANCE_HISTORY_DAYS', 30))
+# Change feed events kept for SSE clients resuming with Last-Event-ID
+MAINTENANCE_EVENTS_RETENTION_HOURS = int(os.getenv('MAINTENANCE_EVENTS_RETENTION_HOURS', 24))
+# Closed requests stay in the hot table this long before being archived
+MAINTENANCE_ARCHIVE_AFTER_DAYS = int(os.getenv('MAINTENANCE_ARCHIVE_AFTER_DAYS', 30))
+# Triggers keep the counters exact, so this only catches rare drift
+MAINTENANCE_COUNTERS_INTERVAL = float(os.getenv('MAINTENANCE_COUNTERS_INTERVAL', 86400))
+
+# Session advisory lock held by the one process that runs the jobs
+LEADER_LOCK = 'equipment_lending.maintenance'
+
+def run_batched(conn, query, batch_size, max_batches, params=()):
+    """Run a statement that touches at most LIMIT %s rows until it runs dry
+
+    params fill the placeholders before the LIMIT, which comes last.
+
+    Each batch commits on its own, so row locks are held briefly and a
+    failure only loses the batch in flight.
+    """
+    rows = 0
+    with conn.cursor() as cursor:
+        for _ in range(max_batches):
+            cursor.execute(query, (*params, batch_size))
+            touched = cursor.rowcount
+            conn.commit()
+            rows += touched
+            if touched < batch_size:
+                break
+    return rows
+
+def expire_stale_pending(conn, batch_size, max_batches):
+    """Pending requests whose start date has passed can no longer be approved"""
+    return run_batched(
+        conn,
+        '''WITH batch AS (
+             SELECT id FROM borrowing_requests
+             WHERE status = 'pending' AND start_date < CURRENT_DATE
+             ORDER BY id LIMIT %s
+             FOR UPDATE SKIP LOCKED
+           )
+           UPDATE borrowing_requests br
+           SET status = 'expired', updated_at = CURRENT_TIMESTAMP
+           FROM batch WHERE br.id = batch.id''',
+        batch_size,
+        max_batches
+    )
+
+def flag_overdue(conn, batch_size, max_batches):
+    """Approved loans past their end date that have not been returned"""
+    return run_batched(
+        conn,
+        '''WITH batch AS (
+             SELECT id FROM borrowing_requests
+             WHERE status = 'approved' AND NOT overdue AND end_date < CURRENT_DATE
+             ORDER BY id LIMIT %s
+             FOR UPDATE SKIP LOCKED
+           )
+           UPDATE borrowing_requests br
+           SET overdue = TRUE, updated_at = CURRENT_TIMESTAMP
+           FROM batch WHERE br.id = batch.id''',
+        batch_size,
+        max_batches
+    )
+
+def archive_closed_requests(conn, batch_size, max_batches):
+    """Move long-closed requests to borrowing_requests_archive
+
+    Delete and insert happen in one statement, so a request is always in
+    exactly one of the two tables; the triggers treat the move as neither a
+    deletion (no tombstone) nor a change in the per-status counts.
+    """
+    return run_batched(
+        conn,
+        '''WITH batch AS (
+             SELECT id FROM borrowing_requests
+             WHERE status IN ('rejected', 'returned', 'expired')
+             AND updated_at < CURRENT_TIMESTAMP - %s * interval '1 day'
+             ORDER BY id LIMIT %s
+             FOR UPDATE SKIP LOCKED
+           ), moved AS (
+             DELETE FROM borrowing_requests br USING batch
+             WHERE br.id = batch.id
+             RETURNING br.*
+           )
+           INSERT INTO borrowing_requests_archive
+             (id, user_id, equipment_id, request_date, start_date, end_date, status, overdue,
+              approved_by, approval_date, return_date, created_at, updated_at)
+           SELECT id, user_id, equipment_id, request_date, start_date, end_date, status, overdue,
+                  approved_by, approval_date, return_date, created_at, updated_at
+           FROM moved''',
+        batch_size,
+        max_batches,
+        (MAINTENANCE_ARCHIVE_AFTER_DAYS,)
+    )
+
+def refresh_counters(conn, batch_size, max_batches):
+    """Correct dashboard counters that drifted from the base tables
+
+    Adds only the differences and takes no table lock, so dashboard reads
+    and trigger updates carry on while the counts run.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT repair_stats_counters()')
+        rows = cursor.fetchone()[0]
+    conn.commit()
+    return rows
+
+def prune_run_history(conn, batch_size, max_batches):
+    """Drop maintenance_runs rows older than MAINTENANCE_HISTORY_DAYS"""
+    return run_batched(
+        conn,
+        '''DELETE FROM maintenance_runs WHERE id IN (
+              SELECT id FROM maintenance_runs
+              WHERE started_at < CURRENT_TIMESTAMP - %s * interval '1 day'
+              LIMIT %s
+            )''',
+        batch_size,
+        max_batches,
+        (MAINTENANCE_HISTORY_DAYS,)
+    )
+
+def prune_request_events(conn, batch_size, max_batches):
+    """Drop request_events older than MAINTENANCE_EVENTS_RETENTION_HOURS"""
+    return run_batched(
+        conn,
+        '''DELETE FROM request_events WHERE id IN (
+              SELECT id FROM request_events
+              WHERE created_at < CURRENT_TIMESTAMP - %s * interval '1 hour'
+              LIMIT %s
+            )''',
+        batch_size,
+        max_batches,
+        (MAINTENANCE_EVENTS_RETENTION_HOURS,)
+    )
+
+Job = namedtuple('Job', ['name', 'run', 'interval'])
+
+JOBS = [
+    Job('expire_stale_pending', expire_stale_pending, MAINTENANCE_INTERVAL),
+    Job('flag_overdue', flag_overdue, MAINTENANCE_INTERVAL),
+    Job('archive_closed_requests', archive_closed_requests, 3600),
+    Job('refresh_counters', refresh_counters, MAINTENANCE_COUNTERS_INTERVAL),
+    Job('prune_run_history', prune_run_history, 86400),
+    Job('prune_request_events', prune_request_events, 3600)
+]
+
+def run_job(conn, job):
+    """Run one job and record how long it took and how many rows it touched"""
+    started_at = datetime.now()
+    started = time.perf_counter()
+    rows = 0
+    error = None
+    try:
+        rows = job.run(conn, MAINTENANCE_BATCH_SIZE, MAINTENANCE_MAX_BATCHES)
+    except psycopg2.OperationalError:
+        # The connection itself is gone; let the scheduler reconnect
+        raise
+    except psycopg2.Error as e:
+        conn.rollback()
+        error = str(e)
+    duration_ms = (time.perf_counter() - started) * 1000
+
+    with conn.cursor() as cursor:
+        cursor.execute(
+            '''INSERT INTO maintenance_runs (job, started_at, duration_ms, rows_affected, error)
+               VALUES (%s, %s, %s, %s, %s)''',
+            (job.name, started_at, round(duration_ms, 3), rows, error)
+        )
+    conn.commit()
+
+    print(f"Maintenance {job.name}: {rows} rows in {duration_ms:.1f} ms" + (f" (failed: {error})" if error else ''))
+    return {'job': job.name, 'rows': rows, 'duration_ms': round(duration_ms, 3), 'error': error}
+
+def try_become_leader(conn):
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_lock(hashtext(%s))', (LEADER_LOCK,))
+        return cursor.fetchone()[0]
+
+class MaintenanceScheduler(threading.Thread):
+    """Runs JOBS on their intervals in whichever process holds the leader lock
+
+    The lock lives on a dedicated session, so it is released the moment the
+    leader's connection or process dies and another process takes over on
+    its next tick.
+    """
+
+    def __init__(self, tick=MAINTENANCE_TICK):
+        super().__init__(name='maintenance', daemon=True)
+        self.tick = tick
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            conn = None
+            try:
+                conn = open_dedicated_connection()
+                if try_become_leader(conn):
+                    conn.autocommit = False
+                    self.lead(conn)
+            except psycopg2.Error as e:
+                print(f"Maintenance scheduler lost its connection: {e}")
+            except Exception as e:
+                # Anything else would end the thread for good; drop the lock
+                # (by closing the session) and try again next tick
+                print(f"Maintenance scheduler failed: {e!r}")
+            finally:
+                if conn is not None:
+                    conn.close()
+            self.stopped.wait(self.tick)
+
+    def lead(self, conn):
+        next_run = {job.name: 0.0 for job in JOBS}
+        while not self.stopped.is_set():
+            for job in JOBS:
+                if time.monotonic() >= next_run[job.name]:
+                    run_job(conn, job)
+                    next_run[job.name] = time.monotonic() + job.interval
+            self.stopped.wait(self.tick)
+
+    def stop(self):
+        self.stopped.set()
+
+scheduler = None
+_scheduler_lock = threading.Lock()
+
+def start_scheduler():
+    """Start this process's scheduler thread once"""
+    global scheduler
+    if scheduler is not None:
+        return
+    with _scheduler_lock:
+        if scheduler is None:
+            scheduler = MaintenanceScheduler()
+            scheduler.start()
+
+def ensure_scheduler():
+    # Started on the first request, so the bcrypt pool's spawned children
+    # never join the leader election
+    start_scheduler()
+
+def init_app(app):
+    """Run the maintenance jobs from the web workers unless disabled"""
+    if MAINTENANCE_ENABLED:
+        app.before_request(ensure_scheduler)
+
+def main():
+    parser = argparse.ArgumentParser(description='Run maintenance jobs outside the web workers')
+    parser.add_argument('--once', action='store_true', help='Run every job once and exit')
+    args = parser.parse_args()
+
+    if not args.once:
+        worker = MaintenanceScheduler()
+        worker.start()
+        try:
+            while worker.is_alive():
+                worker.join(1)
+        except KeyboardInterrupt:
+            worker.stop()
+        return
+
+    conn = open_dedicated_connection()
+    try:
+        if not try_become_leader(conn):
+            raise SystemExit('Another process holds the maintenance lock')
+        conn.autocommit = False
+        for job in JOBS:
+            run_job(conn, job)
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+import argparse
+import os
+import threading
+import time
+import bcrypt
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+# Target bcrypt work factor; run `python -m services.passwords` to calibrate it
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+BCRYPT_WORKERS = int(os.getenv('BCRYPT_WORKERS', os.cpu_count() or 2))
+# Hashing jobs allowed to queue or run at once before callers get a 503
+BCRYPT_MAX_QUEUE = int(os.getenv('BCRYPT_MAX_QUEUE', 64))
+BCRYPT_TIMEOUT = float(os.getenv('BCRYPT_TIMEOUT', 10))
+
+class PasswordPoolBusy(Exception):
+    """Raised when the hashing pool is saturated or too slow to answer"""
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(BCRYPT_MAX_QUEUE)
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+def _check(password, hashed):
+    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn: never fork a multi-threaded web worker
+            _executor = ProcessPoolExecutor(max_workers=BCRYPT_WORKERS, mp_context=get_context('spawn'))
+        return _executor
+
+def _reset_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+def _run(fn, *args):
+    """Run a bcrypt call in the process pool, failing fast when it is saturated
+    
+    A job keeps its slot until it is really done, not just until the caller
+    gives up waiting, so BCRYPT_MAX_QUEUE bounds the executor's backlog.
+    """
+    if not _slots.acquire(blocking=False):
+        raise PasswordPoolBusy('Password hashing queue is full')
+    try:
+        future = _get_executor().submit(fn, *args)
+    except BrokenProcessPool:
+        _slots.release()
+        _reset_executor()
+        raise PasswordPoolBusy('Password hashing pool restarted')
+    except BaseException:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    try:
+        return future.result(timeout=BCRYPT_TIMEOUT)
+    except FutureTimeout:
+        # Drop the job if it has not started yet; a running one finishes
+        future.cancel()
+        raise PasswordPoolBusy('Password hashing timed out')
+    except BrokenProcessPool:
+        _reset_executor()
+        raise PasswordPoolBusy('Password hashing pool restarted')
+
+def hash_password(password, rounds=None):
+    """Hash a password at the configured work factor"""
+    return _run(_hash, password, rounds or BCRYPT_ROUNDS)
+
+def verify_password(password, hashed):
+    """Check a password against a stored bcrypt hash"""
+    return _run(_check, password, hashed)
+
+def get_cost(hashed):
+    """Work factor encoded in a bcrypt hash ($2b$<cost>$...)"""
+    return int(hashed.split('$')[2])
+
+def needs_rehash(hashed):
+    """True when a stored hash was made at a different work factor than the target"""
+    try:
+        return get_cost(hashed) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+def calibrate(target_ms, min_rounds=10, max_rounds=16, samples=3):
+    """Highest work factor whose median hash time stays within target_ms"""
+    chosen = min_rounds
+    timings = {}
+    for rounds in range(min_rounds, max_rounds + 1):
+        durations = []
+        for _ in range(samples):
+            started = time.perf_counter()
+            _hash('calibration-password', rounds)
+            durations.append((time.perf_counter() - started) * 1000)
+        timings[rounds] = sorted(durations)[len(durations) // 2]
+        if timings[rounds] > target_ms:
+            break
+        chosen = rounds
+    return chosen, timings
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pick BCRYPT_ROUNDS for a target hashing latency on this machine')
+    parser.add_argument('--target-ms', type=float, default=250, help='target time per hash in milliseconds')
+    parser.add_argument('--min-rounds', type=int, default=10)
+    parser.add_argument('--max-rounds', type=int, default=16)
+    args = parser.parse_args()
+    
+    rounds, timings = calibrate(args.target_ms, args.min_rounds, args.max_rounds)
+    for cost, ms in timings.items():
+        print(f'cost {cost}: {ms:.1f} ms')
+    print(f'BCRYPT_ROUNDS={rounds}')
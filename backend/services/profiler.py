@@ -0,0 +1,124 @@
+import re
+import threading
+from collections import deque
+import psycopg2
+import psycopg2.extensions
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_PARAM = re.compile(r'%\(\w+\)s|%s')
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)')
+_SPACE = re.compile(r'\s+')
+
+def fingerprint(query, cursor=None):
+    """Normalize a statement so every execution of the same SQL shares a key
+    
+    Literals and placeholders become ?, IN lists collapse and whitespace is
+    squeezed.
+    """
+    if hasattr(query, 'as_string'):
+        query = query.as_string(cursor)
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    text = _STRING.sub('?', query)
+    text = _PARAM.sub('?', text)
+    text = _NUMBER.sub('?', text)
+    text = _IN_LIST.sub('(?)', text)
+    return _SPACE.sub(' ', text).strip()
+
+def explain(cursor):
+    """EXPLAIN (ANALYZE, BUFFERS) the statement cursor just ran
+    
+    Runs inside a savepoint on the same connection, so it sees the same
+    transaction state and cannot abort it.
+    """
+    conn = cursor.connection
+    if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_INTRANS:
+        return None
+    
+    # A plain cursor, so the EXPLAIN itself is not timed or profiled
+    explain_cursor = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+    try:
+        explain_cursor.execute('SAVEPOINT query_profile')
+        try:
+            explain_cursor.execute(b'EXPLAIN (ANALYZE, BUFFERS) ' + cursor.query)
+            plan = '\n'.join(row[0] for row in explain_cursor.fetchall())
+            explain_cursor.execute('RELEASE SAVEPOINT query_profile')
+            return plan
+        except psycopg2.Error as e:
+            explain_cursor.execute('ROLLBACK TO SAVEPOINT query_profile')
+            return f'EXPLAIN failed: {e}'
+    finally:
+        explain_cursor.close()
+
+class QueryProfiler:
+    """Process-wide statement statistics, slow log and N+1 findings"""
+    
+    def __init__(self, slow_ms, explain_first, n_plus_one, max_fingerprints=500, slow_log_size=100):
+        self.slow_ms = slow_ms
+        self.explain_first = explain_first
+        self.n_plus_one = n_plus_one
+        self.max_fingerprints = max_fingerprints
+        self.slow_log = deque(maxlen=slow_log_size)
+        self._stats = {}
+        self._explained = {}
+        self._findings = {}
+        self._lock = threading.Lock()
+    
+    def record(self, key, elapsed):
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                if len(self._stats) >= self.max_fingerprints:
+                    return
+                stats = self._stats[key] = {'calls': 0, 'total': 0.0, 'max': 0.0}
+            stats['calls'] += 1
+            stats['total'] += elapsed
+            stats['max'] = max(stats['max'], elapsed)
+    
+    def should_explain(self, key):
+        """True for the first explain_first slow executions of a fingerprint"""
+        with self._lock:
+            count = self._explained.get(key, 0)
+            if count >= self.explain_first:
+                return False
+            self._explained[key] = count + 1
+            return True
+    
+    def log_slow(self, entry):
+        with self._lock:
+            self.slow_log.append(entry)
+    
+    def flag_n_plus_one(self, endpoint, key, calls):
+        with self._lock:
+            finding = self._findings.setdefault((endpoint, key), {'requests': 0, 'max_calls': 0})
+            finding['requests'] += 1
+            finding['max_calls'] = max(finding['max_calls'], calls)
+    
+    def report(self, limit=50):
+        with self._lock:
+            statements = sorted(self._stats.items(), key=lambda item: item[1]['total'], reverse=True)
+            return {
+                'statements': [
+                    {
+                        'fingerprint': key,
+                        'calls': stats['calls'],
+                        'total_ms': round(stats['total'] * 1000, 3),
+                        'mean_ms': round(stats['total'] / stats['calls'] * 1000, 3),
+                        'max_ms': round(stats['max'] * 1000, 3)
+                    }
+                    for key, stats in statements[:limit]
+                ],
+                'n_plus_one': [
+                    {'endpoint': endpoint, 'fingerprint': key, **finding}
+                    for (endpoint, key), finding in sorted(self._findings.items())
+                ],
+                'slow': list(self.slow_log)
+            }
+    
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._explained.clear()
+            self._findings.clear()
+            self.slow_log.clear()
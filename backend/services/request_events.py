@@ -0,0 +1,176 @@
+import json
+import os
+import queue
+import threading
+from collections import deque
+from config.database import get_db_connection, return_db_connection
+from services.invalidation import listen
+
+# Postgres channel carrying one request_events row as JSON (see db/init.sql)
+CHANNEL = 'request_events'
+
+SSE_HEARTBEAT = float(os.getenv('SSE_HEARTBEAT', 15))
+# Events buffered for one slow client before it is told to resync
+SSE_QUEUE_SIZE = int(os.getenv('SSE_QUEUE_SIZE', 256))
+# Most missed events replayed on reconnect; past this the client resyncs
+SSE_RESUME_LIMIT = int(os.getenv('SSE_RESUME_LIMIT', 1000))
+# Ids are taken when a request changes, not when it commits, so an event may
+# land below one already sent. Resuming also replays events logged within
+# this many seconds of the last one seen; clients drop the repeats by id.
+SSE_RESUME_WINDOW_SECONDS = int(os.getenv('SSE_RESUME_WINDOW_SECONDS', 30))
+# Open streams per worker process. Each one keeps an OS thread of the threaded
+# server blocked for as long as it stays open (see the README's SSE section)
+SSE_MAX_SUBSCRIBERS = int(os.getenv('SSE_MAX_SUBSCRIBERS', 500))
+
+EVENT_SELECT = 'SELECT id, request_id, user_id, equipment_id, event, status FROM request_events'
+# Events after last_id, plus those logged up to the window before it
+EVENTS_AFTER = '''WHERE (id > %s OR created_at > (
+                    SELECT created_at - make_interval(secs => %s) FROM request_events WHERE id = %s
+                  ))'''
+
+class TooManySubscribers(Exception):
+    pass
+
+def serialize_event(row):
+    """Convert an EVENT_SELECT row to a JSON-ready dict"""
+    return {
+        'id': row[0],
+        'request_id': row[1],
+        'user_id': row[2],
+        'equipment_id': row[3],
+        'event': row[4],
+        'status': row[5]
+    }
+
+class Subscription:
+    """One open stream: a bounded queue of the events its caller may see"""
+
+    def __init__(self, user_id=None):
+        # None means every request (staff and admins)
+        self.user_id = user_id
+        self.queue = queue.Queue(SSE_QUEUE_SIZE)
+        self.overflowed = False
+
+    def offer(self, event):
+        if self.user_id is not None and event['user_id'] != self.user_id:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+    def drain(self):
+        """Drop everything queued; the client is about to refetch instead"""
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def get(self, timeout):
+        """Next event, or None after timeout seconds of silence"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+class EventBroker:
+    """Fans request events from the worker's one LISTEN connection out to streams
+
+    Subscribers never touch the database, so an idle stream costs a queue
+    and the thread serving it; that thread is blocked until the stream
+    closes.
+    """
+
+    def __init__(self, recent_size=4096):
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.last_id = None
+        # Ids already delivered, so catch-up after a reconnect sends nothing twice
+        self.recent = deque(maxlen=recent_size)
+        self.recent_ids = set()
+
+    def subscribe(self, user_id=None):
+        subscription = Subscription(user_id)
+        with self.lock:
+            if len(self.subscribers) >= SSE_MAX_SUBSCRIBERS:
+                raise TooManySubscribers()
+            self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscribers.discard(subscription)
+
+    def count(self):
+        return len(self.subscribers)
+
+    def publish(self, event):
+        with self.lock:
+            if event['id'] in self.recent_ids:
+                return
+            if len(self.recent) == self.recent.maxlen:
+                self.recent_ids.discard(self.recent[0])
+            self.recent.append(event['id'])
+            self.recent_ids.add(event['id'])
+            self.last_id = max(self.last_id or 0, event['id'])
+            subscribers = list(self.subscribers)
+        for subscription in subscribers:
+            subscription.offer(event)
+
+    def dispatch(self, payload):
+        try:
+            event = json.loads(payload)
+            event['id'] = int(event['id'])
+        except (ValueError, KeyError, TypeError):
+            return
+        self.publish(event)
+
+    def catch_up(self, conn):
+        """Replay events committed while the listener was disconnected"""
+        with conn.cursor() as cursor:
+            if self.last_id is None:
+                # First connect: nothing was missed, just remember where we are
+                cursor.execute('SELECT COALESCE(MAX(id), 0) FROM request_events')
+                self.last_id = cursor.fetchone()[0]
+                return
+            # publish skips the ones already delivered (recent_ids)
+            cursor.execute(
+                EVENT_SELECT + ' ' + EVENTS_AFTER + ' ORDER BY id',
+                (self.last_id, SSE_RESUME_WINDOW_SECONDS, self.last_id)
+            )
+            for row in cursor.fetchall():
+                self.publish(serialize_event(row))
+
+broker = EventBroker()
+
+listen(CHANNEL, broker.dispatch, broker.catch_up)
+
+def events_since(last_id, user_id=None, limit=SSE_RESUME_LIMIT):
+    """Events after last_id visible to user_id (None for all), oldest first
+
+    Includes events logged within SSE_RESUME_WINDOW_SECONDS before last_id,
+    which may have committed after it; the client may have seen some of them.
+    Returns None when they cannot all be replayed (more than limit, or
+    older ones already pruned) and the client should refetch instead.
+    Reads the primary: replicas may not have the latest events yet.
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT MIN(id) FROM request_events')
+            oldest = cursor.fetchone()[0]
+            query = EVENT_SELECT + ' ' + EVENTS_AFTER
+            params = [last_id, SSE_RESUME_WINDOW_SECONDS, last_id]
+            if user_id is not None:
+                query += ' AND user_id = %s'
+                params.append(user_id)
+            cursor.execute(query + ' ORDER BY id LIMIT %s', (*params, limit + 1))
+            rows = cursor.fetchall()
+        conn.commit()
+    finally:
+        return_db_connection(conn)
+
+    if (oldest is not None and oldest > last_id + 1) or len(rows) > limit:
+        return None
+    return [serialize_event(row) for row in rows]
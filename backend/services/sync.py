@@ -0,0 +1,30 @@
+import os
+from datetime import datetime
+from config.database import query_db
+
+# Rows written by transactions still in flight carry a timestamp from when
+# those transactions began, so each watermark trails the clock by this much.
+# Clients may see a few rows twice; they never miss one.
+SYNC_SAFETY_WINDOW_SECONDS = int(os.getenv('SYNC_SAFETY_WINDOW_SECONDS', 30))
+
+def parse_since(value):
+    """Parse a ?since= watermark; raises ValueError on malformed input"""
+    return datetime.fromisoformat(value)
+
+def get_watermark():
+    """Watermark to hand back to the client for its next sync"""
+    row = query_db(
+        'SELECT (CURRENT_TIMESTAMP - make_interval(secs => %s))::timestamp',
+        (SYNC_SAFETY_WINDOW_SECONDS,),
+        fetch_one=True
+    )
+    return row[0]
+
+def get_tombstones(table_name, since, owner_id=None):
+    """Ids deleted from a table after the watermark"""
+    query = 'SELECT DISTINCT row_id FROM deleted_rows WHERE table_name = %s AND deleted_at > %s'
+    params = [table_name, since]
+    if owner_id is not None:
+        query += ' AND owner_id = %s'
+        params.append(owner_id)
+    return [row[0] for row in query_db(query, tuple(params), fetch_all=True)]
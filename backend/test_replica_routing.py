@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""Test script to verify which server (primary or replica) each read goes to
+
+Runs without a database: the pools hand out fake connections that record
+every statement, so the routing of a real request can be checked.
+"""
+
+import os
+
+os.environ['DB_REPLICA_HOSTS'] = 'replica:5432'
+os.environ['CACHE_INVALIDATION_LISTEN'] = '0'
+os.environ['MAINTENANCE_ENABLED'] = '0'
+
+import psycopg2.extensions
+import config.database as database
+from flask_jwt_extended import create_access_token
+from middleware.auth import token_versions
+from middleware.cache import response_cache
+from app import app
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.connection = conn
+        self.result = []
+
+    def execute(self, query, params=None):
+        self.connection.statements.append(query)
+        if 'token_version' in query:
+            self.result = [(0,)]
+        elif 'FROM equipment WHERE id' in query:
+            self.result = [(1, 'Camera', 'Electronics', 'good', 3, 'DSLR')]
+        else:
+            self.result = []
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def fetchall(self):
+        return self.result
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class FakeConnection:
+    closed = False
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.statements = pool.statements
+        self.info = type('Info', (), {'transaction_status': psycopg2.extensions.TRANSACTION_STATUS_IDLE})()
+
+    def cursor(self, cursor_factory=None):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+class FakePool:
+    def __init__(self):
+        self.statements = []
+
+    def getconn(self):
+        return FakeConnection(self)
+
+    def putconn(self, conn, close=False):
+        pass
+
+    def stats(self):
+        return {'in_use': 0, 'waiters': 0}
+
+def setup():
+    """Fresh primary and replica pools, with the replica caught up"""
+    primary, replica_pool = FakePool(), FakePool()
+    database.connection_pool = primary
+    replica = database.Replica('replica:5432', replica_pool)
+    replica.lag = 0.0
+    replica.checked_at = float('inf')
+    database.replicas = [replica]
+    response_cache.clear()
+    token_versions.clear()
+    return primary, replica_pool
+
+def auth_header():
+    with app.app_context():
+        token = create_access_token(
+            identity='7',
+            additional_claims={'email': 'a@example.com', 'name': 'A', 'role': 'student', 'ver': 0}
+        )
+    return {'Authorization': f'Bearer {token}'}
+
+def test_cache_miss_reads_primary():
+    """Every statement of a cached endpoint's miss, auth and ETag included"""
+    primary, replica = setup()
+    response = app.test_client().get('/api/equipment/1', headers=auth_header())
+    assert response.status_code == 200, response.get_json()
+    assert response.headers['X-Cache'] == 'MISS'
+    assert primary.statements, 'the miss should have queried the primary'
+    assert replica.statements == [], replica.statements
+
+def test_token_version_reads_primary():
+    """Even on a request whose other reads go to a replica"""
+    primary, replica = setup()
+    app.test_client().get('/api/requests', headers=auth_header())
+    assert any('token_version' in query for query in primary.statements), primary.statements
+    assert not any('token_version' in query for query in replica.statements), replica.statements
+
+def test_table_versions_read_primary():
+    """ETags must reflect the latest write, whatever serves the response"""
+    primary, replica = setup()
+    app.test_client().get('/api/requests', headers=auth_header())
+    assert any('table_versions' in query for query in primary.statements), primary.statements
+    assert not any('table_versions' in query for query in replica.statements), replica.statements
+
+def test_uncached_read_uses_replica():
+    primary, replica = setup()
+    response = app.test_client().get('/api/requests', headers=auth_header())
+    assert response.status_code == 200, response.get_json()
+    assert any('borrowing_requests' in query for query in replica.statements), replica.statements
+
+if __name__ == '__main__':
+    for test in (
+        test_cache_miss_reads_primary,
+        test_token_version_reads_primary,
+        test_table_versions_read_primary,
+        test_uncached_read_uses_replica
+    ):
+        test()
+        print(f"✓ {test.__name__}")
+    print("\n✅ Reads are routed as expected")
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""Load benchmark for the Equipment Lending API
+
+Drives every endpoint against a running server seeded with
+benchmarks/seed.py. Each endpoint is measured on its own for --duration
+seconds at --concurrency, and the results are written as JSON:
+
+    python benchmarks/run.py run --concurrency 16 --duration 20 --output before.json
+    python benchmarks/run.py compare before.json after.json --threshold 10
+"""
+
+import argparse
+import itertools
+import json
+import math
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+
+import requests
+
+from seed import BENCH_PASSWORD, admin_email, staff_email, student_email
+
+# Read-only scenarios first, so writes cannot skew them
+SCENARIOS = [
+    # name, role, method, path, body
+    ('health', None, 'GET', lambda ctx: '/health', None),
+    ('auth_me', 'student', 'GET', lambda ctx: '/api/auth/me', None),
+    ('get_equipment', 'student', 'GET', lambda ctx: '/api/equipment', None),
+    ('get_equipment_by_category', 'student', 'GET',
+     lambda ctx: f"/api/equipment?category={ctx.choice('categories')}", None),
+    ('get_equipment_since', 'student', 'GET',
+     lambda ctx: f"/api/equipment?since={ctx.watermark}", None),
+    ('search_equipment', 'student', 'GET',
+     lambda ctx: f"/api/equipment/search?q={ctx.choice('search_terms')}", None),
+    ('autocomplete_equipment', 'student', 'GET',
+     lambda ctx: f"/api/equipment/search?mode=autocomplete&q={ctx.choice('search_terms')[:3]}", None),
+    ('get_equipment_by_id', 'student', 'GET',
+     lambda ctx: f"/api/equipment/{ctx.choice('equipment_ids')}", None),
+    ('get_equipment_availability', 'student', 'GET',
+     lambda ctx: f"/api/equipment/{ctx.choice('equipment_ids')}/availability", None),
+    ('get_categories', 'student', 'GET', lambda ctx: '/api/equipment/categories', None),
+    ('export_equipment', 'admin', 'GET', lambda ctx: '/api/equipment/export', None),
+    ('get_requests_student', 'student', 'GET', lambda ctx: '/api/requests', None),
+    ('get_requests_page', 'staff', 'GET', lambda ctx: '/api/requests?limit=50', None),
+    ('get_requests_pending', 'staff', 'GET', lambda ctx: '/api/requests?status=pending&limit=50', None),
+    ('get_requests_since', 'staff', 'GET', lambda ctx: f"/api/requests?since={ctx.watermark}", None),
+    ('get_request_by_id', 'staff', 'GET', lambda ctx: f"/api/requests/{ctx.choice('request_ids')}", None),
+    ('export_requests', 'staff', 'GET',
+     lambda ctx: f"/api/requests/export?format=ndjson&from={ctx.recent}", None),
+    ('stream_token', 'student', 'POST', lambda ctx: '/api/requests/stream/token', None),
+    # Time to the stream's first bytes (subscribe and auth); see STREAMING
+    ('open_stream', 'student', 'GET', lambda ctx: '/api/requests/stream', None),
+    ('dashboard_stats', 'admin', 'GET', lambda ctx: '/api/dashboard/stats', None),
+    ('dashboard_queries', 'admin', 'GET', lambda ctx: '/api/dashboard/queries', None),
+    ('dashboard_maintenance', 'admin', 'GET', lambda ctx: '/api/dashboard/maintenance', None),
+    ('login', None, 'POST', lambda ctx: '/api/auth/login',
+     lambda ctx: {'email': ctx.next_student_email(), 'password': BENCH_PASSWORD}),
+    ('register', None, 'POST', lambda ctx: '/api/auth/register',
+     lambda ctx: {'email': f'bench-new-{ctx.unique()}@example.com', 'password': BENCH_PASSWORD,
+                  'name': 'Bench Signup', 'role': 'student'}),
+    ('create_request', 'student', 'POST', lambda ctx: '/api/requests', lambda ctx: ctx.new_request()),
+    ('approve_request', 'staff', 'PUT', lambda ctx: f"/api/requests/{ctx.take('approve')}/approve", None),
+    ('reject_request', 'staff', 'PUT', lambda ctx: f"/api/requests/{ctx.take('reject')}/reject", None),
+    ('return_request', 'staff', 'PUT', lambda ctx: f"/api/requests/{ctx.take('return')}/return", None),
+    ('bulk_approve', 'staff', 'POST', lambda ctx: '/api/requests/bulk',
+     lambda ctx: {'actions': [{'id': ctx.take('bulk'), 'action': 'approve'} for _ in range(20)]}),
+    ('create_equipment', 'admin', 'POST', lambda ctx: '/api/equipment',
+     lambda ctx: {'name': f'Benchmark Item {ctx.unique()}', 'category': 'Benchmark',
+                  'condition': 'good', 'quantity': 2, 'description': 'Created by the benchmark'}),
+    ('update_equipment', 'admin', 'PUT', lambda ctx: f"/api/equipment/{ctx.choice('equipment_ids')}",
+     lambda ctx: {'description': f'Updated by the benchmark {ctx.unique()}'}),
+    ('import_equipment', 'admin', 'POST', lambda ctx: '/api/equipment/import?format=ndjson',
+     lambda ctx: ''.join(json.dumps({'name': f'Benchmark Item {ctx.unique()}', 'category': 'Benchmark',
+                                     'condition': 'fair', 'quantity': 1}) + '\n' for _ in range(100))),
+    ('delete_equipment', 'admin', 'DELETE', lambda ctx: f"/api/equipment/{ctx.take('delete')}", None),
+    # Last: clears the profiler statistics the other scenarios built up
+    ('reset_query_report', 'admin', 'DELETE', lambda ctx: '/api/dashboard/queries', None)
+]
+
+# Endpoints that never finish on their own: the request ends at the first
+# chunk, and the connection is closed so the server drops the subscriber
+STREAMING = {'open_stream'}
+
+class Exhausted(Exception):
+    """A write scenario ran out of rows to act on"""
+
+class Context:
+    """Tokens and id pools shared by the worker threads"""
+
+    def __init__(self, base_url, students, seed):
+        self.base_url = base_url.rstrip('/')
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counter = itertools.count(int(time.time()))
+        self.students = itertools.cycle(range(1, students + 1))
+        self.student_count = students
+        self.tokens = {}
+        self.pools = {}
+        self.queues = {}
+        self.watermark = None
+        self.recent = (date.today() - timedelta(days=7)).isoformat()
+
+    def login(self, email):
+        response = requests.post(f'{self.base_url}/api/auth/login', json={'email': email, 'password': BENCH_PASSWORD})
+        response.raise_for_status()
+        return response.json()['token']
+
+    def get(self, path, role='admin'):
+        response = requests.get(f'{self.base_url}{path}', headers=self.headers(role))
+        response.raise_for_status()
+        return response.json()
+
+    def headers(self, role):
+        if role is None:
+            return {}
+        if role == 'student':
+            # Spread reads and writes over several students
+            with self.lock:
+                token = self.tokens['students'][self.rng.randrange(len(self.tokens['students']))]
+            return {'Authorization': f'Bearer {token}'}
+        return {'Authorization': f'Bearer {self.tokens[role]}'}
+
+    def prepare(self):
+        self.tokens['admin'] = self.login(admin_email())
+        self.tokens['staff'] = self.login(staff_email(1))
+        self.tokens['students'] = [self.login(student_email(i)) for i in range(1, self.student_count + 1)]
+
+        equipment = self.get('/api/equipment')
+        # A server-issued watermark, so delta sync sees a realistic window
+        self.watermark = self.get('/api/equipment?since=2000-01-01T00:00:00')['watermark']
+        self.pools['equipment_ids'] = [item['id'] for item in equipment]
+        self.pools['categories'] = sorted({item['category'] for item in equipment})
+        self.pools['search_terms'] = sorted({item['name'].split()[0] for item in equipment})
+        self.pools['request_ids'] = [item['id'] for item in self.get('/api/requests?limit=500')['items']]
+
+        pending = self.collect('/api/requests?status=pending&limit=500', limit=20000,
+                               keep=lambda item: item['start_date'] >= date.today().isoformat())
+        approved = self.collect('/api/requests?status=approved&limit=500', limit=5000)
+        self.rng.shuffle(pending)
+        third = len(pending) // 3
+        self.queues['approve'] = deque(pending[:third])
+        self.queues['reject'] = deque(pending[third:2 * third])
+        self.queues['bulk'] = deque(pending[2 * third:])
+        self.queues['return'] = deque(approved)
+        self.queues['delete'] = deque()
+
+    def collect(self, path, limit, keep=lambda item: True):
+        ids = []
+        cursor = None
+        while len(ids) < limit:
+            page = self.get(path + (f'&cursor={cursor}' if cursor else ''), role='staff')
+            ids.extend(item['id'] for item in page['items'] if keep(item))
+            cursor = page.get('next_cursor')
+            if not cursor:
+                break
+        return ids[:limit]
+
+    def choice(self, pool):
+        with self.lock:
+            return self.rng.choice(self.pools[pool])
+
+    def take(self, queue):
+        with self.lock:
+            if not self.queues[queue]:
+                raise Exhausted(queue)
+            return self.queues[queue].popleft()
+
+    def unique(self):
+        return next(self.counter)
+
+    def next_student_email(self):
+        with self.lock:
+            return student_email(next(self.students))
+
+    def new_request(self):
+        with self.lock:
+            equipment_id = self.rng.choice(self.pools['equipment_ids'])
+            start = date.today() + timedelta(days=self.rng.randrange(30, 365))
+            end = start + timedelta(days=self.rng.randrange(0, 7))
+        return {'equipment_id': equipment_id, 'start_date': start.isoformat(), 'end_date': end.isoformat()}
+
+    def refill_delete_queue(self):
+        """Only equipment the benchmark itself created is ever deleted"""
+        items = self.get('/api/equipment?category=Benchmark')
+        self.queues['delete'] = deque(item['id'] for item in items)
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def run_scenario(ctx, scenario, concurrency, duration):
+    name, role, method, path, body = scenario
+    latencies = []
+    statuses = {}
+    errors = 0
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        nonlocal errors
+        session = requests.Session()
+        streaming = name in STREAMING
+        while time.perf_counter() < deadline:
+            try:
+                url = ctx.base_url + path(ctx)
+                payload = body(ctx) if body else None
+            except Exhausted:
+                return
+            kwargs = {'headers': ctx.headers(role), 'stream': streaming}
+            if isinstance(payload, str):
+                kwargs['data'] = payload.encode('utf-8')
+                kwargs['headers']['Content-Type'] = 'application/x-ndjson'
+            elif payload is not None:
+                kwargs['json'] = payload
+            started = time.perf_counter()
+            try:
+                response = session.request(method, url, **kwargs)
+                if streaming:
+                    with response:
+                        next(response.iter_content(chunk_size=None), None)
+                elapsed = time.perf_counter() - started
+                status = str(response.status_code)
+            except requests.RequestException:
+                elapsed = time.perf_counter() - started
+                status = 'error'
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == 'error' or status.startswith('5'):
+                    errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    ms = lambda value: round(value * 1000, 3) if value is not None else None
+    return {
+        'method': method,
+        'role': role,
+        'requests': len(latencies),
+        'errors': errors,
+        'statuses': statuses,
+        'throughput_rps': round(len(latencies) / wall, 2) if wall else 0.0,
+        'mean_ms': ms(sum(latencies) / len(latencies)) if latencies else None,
+        'p50_ms': ms(percentile(latencies, 0.50)),
+        'p95_ms': ms(percentile(latencies, 0.95)),
+        'p99_ms': ms(percentile(latencies, 0.99)),
+        'max_ms': ms(latencies[-1] if latencies else None)
+    }
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def command_run(args):
+    ctx = Context(args.base_url, args.students, args.seed)
+    ctx.prepare()
+
+    only = set(args.only.split(',')) if args.only else None
+    scenarios = [s for s in SCENARIOS if only is None or s[0] in only]
+    results = {}
+    for scenario in scenarios:
+        if scenario[0] == 'delete_equipment':
+            ctx.refill_delete_queue()
+        if args.warmup:
+            run_scenario(ctx, scenario, args.concurrency, args.warmup)
+        results[scenario[0]] = run_scenario(ctx, scenario, args.concurrency, args.duration)
+        r = results[scenario[0]]
+        print(f"{scenario[0]:<28} {r['requests']:>7} req {r['throughput_rps']:>9.1f} rps "
+              f"p50 {r['p50_ms']} ms  p95 {r['p95_ms']} ms  p99 {r['p99_ms']} ms  errors {r['errors']}")
+
+    report = {
+        'meta': {
+            'base_url': args.base_url,
+            'concurrency': args.concurrency,
+            'duration': args.duration,
+            'warmup': args.warmup,
+            'students': args.students,
+            'seed': args.seed,
+            'git_commit': git_commit(),
+            'started_at': datetime.now(timezone.utc).isoformat()
+        },
+        'endpoints': results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Wrote {args.output}')
+
+def change(before, after):
+    if before in (None, 0) or after is None:
+        return None
+    return round((after - before) / before * 100, 1)
+
+def command_compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)['endpoints']
+    with open(args.candidate) as f:
+        candidate = json.load(f)['endpoints']
+
+    diff = {}
+    regressions = []
+    for name in sorted(baseline.keys() & candidate.keys()):
+        before, after = baseline[name], candidate[name]
+        entry = {
+            key: {'before': before[key], 'after': after[key], 'change_pct': change(before[key], after[key])}
+            for key in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'errors')
+        }
+        p95 = entry['p95_ms']['change_pct']
+        throughput = entry['throughput_rps']['change_pct']
+        entry['regression'] = (
+            (p95 is not None and p95 > args.threshold)
+            or (throughput is not None and throughput < -args.threshold)
+            or after['errors'] > before['errors']
+        )
+        if entry['regression']:
+            regressions.append(name)
+        diff[name] = entry
+        print(f"{name:<28} p95 {before['p95_ms']} -> {after['p95_ms']} ms ({p95:+}%)  "
+              f"rps {before['throughput_rps']} -> {after['throughput_rps']} ({throughput:+}%)"
+              f"{'  REGRESSION' if entry['regression'] else ''}"
+              if p95 is not None and throughput is not None else f'{name:<28} not comparable')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'threshold_pct': args.threshold, 'regressions': regressions, 'endpoints': diff}, f, indent=2)
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+        sys.exit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='Benchmark every endpoint')
+    run.add_argument('--base-url', default='http://localhost:5000')
+    run.add_argument('--concurrency', type=int, default=8)
+    run.add_argument('--duration', type=float, default=10, help='Seconds per endpoint')
+    run.add_argument('--warmup', type=float, default=2, help='Unrecorded seconds before each endpoint')
+    run.add_argument('--students', type=int, default=20, help='Student accounts to spread load over')
+    run.add_argument('--seed', type=int, default=42)
+    run.add_argument('--only', help='Comma-separated scenario names')
+    run.add_argument('--output', default='benchmark.json')
+    run.set_defaults(func=command_run)
+
+    compare = commands.add_parser('compare', help='Diff two benchmark runs')
+    compare.add_argument('baseline')
+    compare.add_argument('candidate')
+    compare.add_argument('--threshold', type=float, default=10,
+                         help='Percent p95 increase or throughput drop that counts as a regression')
+    compare.add_argument('--output', help='Write the diff as JSON')
+    compare.set_defaults(func=command_compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""Deterministic synthetic dataset for the benchmark suite
+
+Replaces ALL data in the target database with N users, M equipment items and
+K borrowing requests. The same --seed and --anchor always produce the same
+rows. Connection settings come from the usual DB_* environment variables.
+
+    python benchmarks/seed.py --reset --users 2000 --equipment 1000 --requests 100000
+"""
+
+import argparse
+import csv
+import io
+import os
+import random
+import sys
+import time
+from itertools import accumulate
+from datetime import date, datetime, timedelta
+
+import bcrypt
+import psycopg2
+
+BENCH_PASSWORD = 'bench123'
+
+CATEGORIES = {
+    'Electronics': ['Camera', 'Projector', 'Laptop', 'Tablet', 'Microphone', 'Speaker', 'Drone'],
+    'Sports': ['Basketball', 'Football', 'Tennis Racket', 'Volleyball', 'Cricket Bat', 'Stopwatch'],
+    'Lab Equipment': ['Microscope', 'Beaker Set', 'Bunsen Burner', 'Multimeter', 'Oscilloscope'],
+    'Musical Instruments': ['Guitar', 'Keyboard', 'Violin', 'Drum Kit', 'Flute', 'Ukulele'],
+    'Art Supplies': ['Easel', 'Paint Set', 'Sketch Kit', 'Clay Tools', 'Light Box'],
+    'Books': ['Atlas', 'Dictionary', 'Lab Manual', 'Encyclopedia', 'Field Guide']
+}
+MODELS = ['Standard', 'Pro', 'Mini', 'Classic', 'Advanced', 'Junior', 'Deluxe', 'Compact']
+CONDITIONS = (['excellent', 'good', 'fair', 'poor'], [25, 45, 22, 8])
+FIRST_NAMES = ['Alex', 'Sam', 'Priya', 'Chen', 'Maria', 'Omar', 'Lena', 'Ravi', 'Aisha', 'Tom',
+               'Yuki', 'Noah', 'Fatima', 'Leo', 'Sofia', 'Arjun', 'Mia', 'Ivan', 'Zara', 'Ben']
+LAST_NAMES = ['Smith', 'Khan', 'Garcia', 'Nair', 'Müller', 'Okafor', 'Tanaka', 'Rossi', 'Silva',
+              'Kumar', 'Brown', 'Haddad', 'Novak', 'Lee', 'Costa', 'Ahmed', 'Jones', 'Park']
+
+def admin_email():
+    return 'bench-admin@example.com'
+
+def staff_email(i):
+    return f'bench-staff-{i}@example.com'
+
+def student_email(i):
+    return f'bench-student-{i}@example.com'
+
+def make_users(rng, count, password_hash):
+    """Admin first, then ~2% staff, then students"""
+    staff_count = max(1, count // 50)
+    users = [(admin_email(), password_hash, 'Bench Admin', 'admin')]
+    for i in range(1, staff_count + 1):
+        users.append((staff_email(i), password_hash, f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}', 'staff'))
+    for i in range(1, count - staff_count):
+        users.append((student_email(i), password_hash, f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}', 'student'))
+    return users
+
+def make_equipment(rng, count):
+    equipment = []
+    for i in range(1, count + 1):
+        category = rng.choice(list(CATEGORIES))
+        base = rng.choice(CATEGORIES[category])
+        name = f'{base} {rng.choice(MODELS)} {i}'
+        condition = rng.choices(*CONDITIONS)[0]
+        # Most items are single units; a few are class sets
+        quantity = rng.choices([1, 2, 3, 5, 10, 20], [40, 25, 15, 10, 7, 3])[0]
+        description = f'{condition.capitalize()} {base.lower()} for {category.lower()} classes'
+        equipment.append((name, category, condition, quantity, description))
+    return equipment
+
+def request_timestamp(rng, anchor, history_days):
+    """Request time in the past history_days, busier on weekdays and in school hours"""
+    while True:
+        day = anchor - timedelta(days=rng.randrange(history_days))
+        if day.weekday() < 5 or rng.random() < 0.3:
+            break
+    hour = min(int(rng.gauss(12, 2.5)), 20)
+    return datetime.combine(day, datetime.min.time()) + timedelta(hours=max(hour, 7), minutes=rng.randrange(60))
+
+def make_requests(rng, count, anchor, history_days, user_ids, equipment):
+    """Borrowing requests whose status follows their dates
+
+    Approved loans never exceed an item's quantity on any day, so the ledger
+    rebuilt from them is consistent with what the API would have allowed.
+    """
+    booked = [dict() for _ in equipment]
+    # Zipf-like popularity over a shuffled catalog: a few items are in
+    # constant demand, most are borrowed now and then
+    popularity = list(range(len(equipment)))
+    rng.shuffle(popularity)
+    cum_weights = list(accumulate(1 / (rank + 1) ** 0.8 for rank in range(len(equipment))))
+    staff_ids = user_ids['staff'] + user_ids['admin']
+    students = user_ids['student']
+    rows = []
+
+    for _ in range(count):
+        equipment_index = popularity[rng.choices(range(len(equipment)), cum_weights=cum_weights)[0]]
+        quantity = equipment[equipment_index][3]
+        requested = request_timestamp(rng, anchor, history_days)
+        start = requested.date() + timedelta(days=min(int(rng.expovariate(1 / 3)), 30))
+        end = start + timedelta(days=min(int(rng.expovariate(1 / 3)), 29))
+
+        if end < anchor:
+            status = rng.choices(['approved', 'rejected', 'pending'], [82, 15, 3])[0]
+        elif start <= anchor:
+            status = rng.choices(['approved', 'rejected'], [90, 10])[0]
+        else:
+            status = rng.choices(['pending', 'approved', 'rejected'], [60, 30, 10])[0]
+
+        if status == 'approved':
+            days = [start + timedelta(days=d) for d in range((end - start).days + 1)]
+            counts = booked[equipment_index]
+            if any(counts.get(day, 0) >= quantity for day in days):
+                status = 'rejected'
+            else:
+                for day in days:
+                    counts[day] = counts.get(day, 0) + 1
+
+        approved_by = approval_date = return_date = None
+        if status in ('approved', 'rejected'):
+            approved_by = rng.choice(staff_ids)
+            approval_date = requested + timedelta(hours=rng.randrange(1, 48))
+        if status == 'approved' and end < anchor:
+            status = 'returned'
+            return_date = datetime.combine(end, datetime.min.time()) + timedelta(
+                days=rng.choices([0, 1, 2], [70, 20, 10])[0], hours=rng.randrange(8, 18))
+
+        rows.append((rng.choice(students), equipment_index + 1, requested, start, end,
+                     status, approved_by, approval_date, return_date))
+    return rows
+
+def copy_rows(cursor, table, columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(['' if value is None else value for value in row])
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--equipment', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=100000)
+    parser.add_argument('--history-days', type=int, default=365)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--anchor', type=date.fromisoformat, default=date.today(),
+                        help='Date treated as "today" when deriving statuses (default: today)')
+    parser.add_argument('--bcrypt-rounds', type=int, default=int(os.getenv('BCRYPT_ROUNDS', 12)),
+                        help='Cost of the shared password hash; match the server to avoid rehash-on-login')
+    parser.add_argument('--archive-after-days', type=int, default=30,
+                        help='Requests closed longer ago than this go straight to the archive table')
+    parser.add_argument('--reset', action='store_true', help='Required: confirms that existing data is replaced')
+    args = parser.parse_args()
+
+    if not args.reset:
+        sys.exit('Seeding replaces all data in the target database; pass --reset to continue')
+    if args.users < 3 or args.equipment < 1:
+        sys.exit('Need at least 3 users and 1 equipment item')
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+
+    # One hash for every account: hashing N passwords would dominate seeding
+    password_hash = bcrypt.hashpw(BENCH_PASSWORD.encode('utf-8'), bcrypt.gensalt(args.bcrypt_rounds)).decode('utf-8')
+    users = make_users(rng, args.users, password_hash)
+    equipment = make_equipment(rng, args.equipment)
+
+    user_ids = {'admin': [], 'staff': [], 'student': []}
+    for user_id, user in enumerate(users, start=1):
+        user_ids[user[3]].append(user_id)
+    requests = make_requests(rng, args.requests, args.anchor, args.history_days, user_ids, equipment)
+
+    conn = psycopg2.connect(
+        host=os.getenv('DB_HOST', 'localhost'),
+        port=os.getenv('DB_PORT', '5432'),
+        database=os.getenv('DB_NAME', 'equipment_lending'),
+        user=os.getenv('DB_USER', 'postgres'),
+        password=os.getenv('DB_PASSWORD', 'postgres')
+    )
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                '''TRUNCATE borrowing_requests, borrowing_requests_archive, equipment_reservations, equipment,
+                   users, deleted_rows, request_events
+                   RESTART IDENTITY CASCADE'''
+            )
+            copy_rows(cursor, 'users', ['email', 'password', 'name', 'role'], users)
+            copy_rows(cursor, 'equipment', ['name', 'category', 'condition', 'quantity', 'description'], equipment)
+            # Historical rows are not news: keep them out of the change feed
+            cursor.execute('ALTER TABLE borrowing_requests DISABLE TRIGGER borrowing_requests_events_insert')
+            copy_rows(cursor, 'borrowing_requests',
+                      ['user_id', 'equipment_id', 'request_date', 'start_date', 'end_date',
+                       'status', 'approved_by', 'approval_date', 'return_date'], requests)
+            cursor.execute('ALTER TABLE borrowing_requests ENABLE TRIGGER borrowing_requests_events_insert')
+            cursor.execute(
+                '''INSERT INTO equipment_reservations (equipment_id, day, reserved)
+                   SELECT equipment_id, d::date, COUNT(*)
+                   FROM borrowing_requests, generate_series(start_date, end_date, interval '1 day') d
+                   WHERE status = 'approved'
+                   GROUP BY equipment_id, d::date'''
+            )
+            # Start from the steady state the archival job maintains
+            cursor.execute(
+                '''WITH moved AS (
+                     DELETE FROM borrowing_requests
+                     WHERE status IN ('rejected', 'returned', 'expired')
+                     AND COALESCE(return_date, approval_date, request_date) < %s
+                     RETURNING *
+                   )
+                   INSERT INTO borrowing_requests_archive
+                     (id, user_id, equipment_id, request_date, start_date, end_date, status, overdue,
+                      approved_by, approval_date, return_date, created_at, updated_at)
+                   SELECT id, user_id, equipment_id, request_date, start_date, end_date, status, overdue,
+                          approved_by, approval_date, return_date, created_at, updated_at
+                   FROM moved''',
+                (args.anchor - timedelta(days=args.archive_after_days),)
+            )
+            archived = cursor.rowcount
+            cursor.execute('SELECT refresh_stats_counters()')
+        conn.commit()
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute('ANALYZE')
+    finally:
+        conn.close()
+
+    statuses = {}
+    for row in requests:
+        statuses[row[5]] = statuses.get(row[5], 0) + 1
+    print(f'Seeded {len(users)} users, {len(equipment)} equipment, {len(requests)} requests '
+          f'{statuses} ({archived} archived) in {time.perf_counter() - started:.1f}s')
+    print(f'Accounts: {admin_email()}, {staff_email(1)}, {student_email(1)}.. (password {BENCH_PASSWORD!r})')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+import { useEffect, useRef } from 'react';
+import api, { subscribeToRequestEvents } from '../services/api';
+
+// Same order as GET /api/requests: newest request_date first, then id
+const byRequestDate = (a, b) =>
+  b.request_date.localeCompare(a.request_date) || b.id - a.id;
+
+// Keeps a request list (filtered by status, '' for all) in step with the
+// live event stream. Rows that newly belong in the list are fetched one at
+// a time; only a reset refetches the whole list.
+const useRequestEvents = (statusFilter, setRequests, refetch) => {
+  const refetchRef = useRef(refetch);
+  refetchRef.current = refetch;
+
+  useEffect(() => {
+    const belongs = (status) => !statusFilter || status === statusFilter;
+
+    const insertRequest = async (requestId) => {
+      try {
+        const response = await api.get(`/requests/${requestId}`);
+        const row = response.data;
+        if (!belongs(row.status)) return;
+        setRequests((current) =>
+          [...current.filter((r) => r.id !== row.id), row].sort(byRequestDate)
+        );
+      } catch (error) {
+        console.error('Error fetching request:', error);
+      }
+    };
+
+    return subscribeToRequestEvents((type, event) => {
+      if (type === 'reset') {
+        refetchRef.current();
+      } else if (!belongs(event.status)) {
+        setRequests((current) => current.filter((r) => r.id !== event.request_id));
+      } else if (type === 'created' || statusFilter) {
+        // New, or just moved into the filtered status
+        insertRequest(event.request_id);
+      } else {
+        setRequests((current) =>
+          current.map((r) => (r.id === event.request_id ? { ...r, status: event.status } : r))
+        );
+      }
+    });
+  }, [statusFilter, setRequests]);
+};
+
+export default useRequestEvents;
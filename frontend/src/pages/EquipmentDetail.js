@@ -25,11 +25,20 @@ const EquipmentDetail = () => {
     start_date: '',
     end_date: '',
   });
+  const [rangeAvailable, setRangeAvailable] = useState(null);
 
   useEffect(() => {
     fetchEquipment();
   }, [id]);
 
+  useEffect(() => {
+    if (formData.start_date && formData.end_date && formData.start_date <= formData.end_date) {
+      fetchAvailability();
+    } else {
+      setRangeAvailable(null);
+    }
+  }, [id, formData.start_date, formData.end_date]);
+
   const fetchEquipment = async () => {
     try {
       const response = await api.get(`/equipment/${id}`);
@@ -41,6 +50,20 @@ const EquipmentDetail = () => {
     }
   };
 
+  const fetchAvailability = async () => {
+    try {
+      const response = await api.get(`/equipment/${id}/availability`, {
+        params: { from: formData.start_date, to: formData.end_date },
+      });
+      // A booking needs a free unit on every day of the range
+      const days = response.data.days;
+      setRangeAvailable(Math.min(...days.map((day) => day.available)));
+    } catch (error) {
+      console.error('Error fetching availability:', error);
+      setRangeAvailable(null);
+    }
+  };
+
   const handleSubmit = async (e) => {
     e.preventDefault();
     setError('');
@@ -166,10 +189,17 @@ const EquipmentDetail = () => {
                 inputProps={{ min: formData.start_date || new Date().toISOString().split('T')[0] }}
               />
             </Box>
+            {rangeAvailable !== null && (
+              <Alert severity={rangeAvailable > 0 ? 'info' : 'warning'} sx={{ mb: 2 }}>
+                {rangeAvailable > 0
+                  ? `${rangeAvailable} of ${equipment.quantity} available for the selected dates`
+                  : 'Not available for the selected dates'}
+              </Alert>
+            )}
             <Button
               type="submit"
               variant="contained"
-              disabled={requesting || equipment.available === 0}
+              disabled={requesting || equipment.available === 0 || rangeAvailable === 0}
             >
               {requesting ? 'Submitting...' : 'Submit Request'}
             </Button>
@@ -18,6 +18,7 @@ import {
   MenuItem,
 } from '@mui/material';
 import api from '../services/api';
+import useRequestEvents from '../hooks/useRequestEvents';
 
 const MyRequests = () => {
   const [requests, setRequests] = useState([]);
@@ -28,6 +29,8 @@ const MyRequests = () => {
     fetchRequests();
   }, [statusFilter]);
 
+  useRequestEvents(statusFilter, setRequests, () => fetchRequests());
+
   const fetchRequests = async () => {
     try {
       const params = statusFilter ? { status: statusFilter } : {};
@@ -46,6 +49,7 @@ const MyRequests = () => {
       approved: 'success',
       rejected: 'error',
       returned: 'info',
+      expired: 'default',
     };
     return colors[status] || 'default';
   };
@@ -81,6 +85,7 @@ const MyRequests = () => {
             <MenuItem value="approved">Approved</MenuItem>
             <MenuItem value="rejected">Rejected</MenuItem>
             <MenuItem value="returned">Returned</MenuItem>
+            <MenuItem value="expired">Expired</MenuItem>
           </Select>
         </FormControl>
       </Box>
@@ -108,6 +113,9 @@ const MyRequests = () => {
                     color={getStatusColor(request.status)}
                     size="small"
                   />
+                  {request.overdue && request.status === 'approved' && (
+                    <Chip label="overdue" color="error" size="small" variant="outlined" sx={{ ml: 1 }} />
+                  )}
                 </TableCell>
               </TableRow>
             ))}
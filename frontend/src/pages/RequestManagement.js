@@ -19,6 +19,10 @@ import {
   Alert,
 } from '@mui/material';
 import api from '../services/api';
+import useRequestEvents from '../hooks/useRequestEvents';
+
+// Matches MAX_BULK_ACTIONS in backend/routes/requests.py
+const MAX_BULK_ACTIONS = 1000;
 
 const RequestManagement = () => {
   const [requests, setRequests] = useState([]);
@@ -30,6 +34,8 @@ const RequestManagement = () => {
     fetchRequests();
   }, [statusFilter]);
 
+  useRequestEvents(statusFilter, setRequests, () => fetchRequests());
+
   const fetchRequests = async () => {
     try {
       const params = statusFilter ? { status: statusFilter } : {};
@@ -87,12 +93,41 @@ const RequestManagement = () => {
     }
   };
 
+  const handleBulk = async (action) => {
+    const actions = requests.map((request) => ({ id: request.id, action }));
+    let succeeded = 0;
+    let failed = 0;
+    try {
+      // The API takes at most MAX_BULK_ACTIONS per call
+      for (let start = 0; start < actions.length; start += MAX_BULK_ACTIONS) {
+        const response = await api.post('/requests/bulk', {
+          actions: actions.slice(start, start + MAX_BULK_ACTIONS),
+        });
+        succeeded += response.data.succeeded;
+        failed += response.data.failed;
+      }
+      setMessage({
+        type: failed ? 'warning' : 'success',
+        text: `${succeeded} request(s) updated${failed ? `, ${failed} failed` : ''}`,
+      });
+    } catch (error) {
+      const done = succeeded ? ` after ${succeeded} request(s) were updated` : '';
+      setMessage({
+        type: 'error',
+        text: (error.response?.data?.error || 'Failed to update requests') + done,
+      });
+    }
+    fetchRequests();
+    setTimeout(() => setMessage({ type: '', text: '' }), 3000);
+  };
+
   const getStatusColor = (status) => {
     const colors = {
       pending: 'warning',
       approved: 'success',
       rejected: 'error',
       returned: 'info',
+      expired: 'default',
     };
     return colors[status] || 'default';
   };
@@ -124,7 +159,22 @@ const RequestManagement = () => {
           {message.text}
         </Alert>
       )}
-      <Box sx={{ mb: 2, display: 'flex', justifyContent: 'flex-end' }}>
+      <Box sx={{ mb: 2, display: 'flex', justifyContent: 'flex-end', gap: 2 }}>
+        {statusFilter === 'pending' && requests.length > 0 && (
+          <>
+            <Button variant="contained" color="success" onClick={() => handleBulk('approve')}>
+              Approve All
+            </Button>
+            <Button variant="contained" color="error" onClick={() => handleBulk('reject')}>
+              Reject All
+            </Button>
+          </>
+        )}
+        {statusFilter === 'approved' && requests.length > 0 && (
+          <Button variant="contained" color="primary" onClick={() => handleBulk('return')}>
+            Mark All Returned
+          </Button>
+        )}
         <FormControl sx={{ minWidth: 200 }}>
           <InputLabel>Filter by Status</InputLabel>
           <Select
@@ -137,6 +187,7 @@ const RequestManagement = () => {
             <MenuItem value="approved">Approved</MenuItem>
             <MenuItem value="rejected">Rejected</MenuItem>
             <MenuItem value="returned">Returned</MenuItem>
+            <MenuItem value="expired">Expired</MenuItem>
           </Select>
         </FormControl>
       </Box>
@@ -173,6 +224,9 @@ const RequestManagement = () => {
                     color={getStatusColor(request.status)}
                     size="small"
                   />
+                  {request.overdue && request.status === 'approved' && (
+                    <Chip label="overdue" color="error" size="small" variant="outlined" sx={{ ml: 1 }} />
+                  )}
                 </TableCell>
                 <TableCell>
                   {request.status === 'pending' && (
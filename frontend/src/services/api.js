@@ -9,6 +9,14 @@ const api = axios.create({
   },
 });
 
+// WAL position of our latest write ('16/B374D848'); echoed so reads never
+// come from a replica that has not replayed it yet
+const isNewerLsn = (lsn, than) => {
+  if (!than) return true;
+  const [a, b] = [lsn, than].map((value) => value.split('/').map((part) => parseInt(part, 16)));
+  return a[0] > b[0] || (a[0] === b[0] && a[1] > b[1]);
+};
+
 // Add token to requests
 api.interceptors.request.use(
   (config) => {
@@ -16,6 +24,10 @@ api.interceptors.request.use(
     if (token) {
       config.headers.Authorization = `Bearer ${token}`;
     }
+    const lsn = localStorage.getItem('dbLsn');
+    if (lsn) {
+      config.headers['X-DB-LSN'] = lsn;
+    }
     return config;
   },
   (error) => {
@@ -25,7 +37,13 @@ api.interceptors.request.use(
 
 // Handle response errors
 api.interceptors.response.use(
-  (response) => response,
+  (response) => {
+    const lsn = response.headers['x-db-lsn'];
+    if (lsn && isNewerLsn(lsn, localStorage.getItem('dbLsn'))) {
+      localStorage.setItem('dbLsn', lsn);
+    }
+    return response;
+  },
   (error) => {
     if (error.response?.status === 401) {
       localStorage.removeItem('token');
@@ -36,5 +54,69 @@ api.interceptors.response.use(
   }
 );
 
+// Live request events over Server-Sent Events. EventSource cannot send an
+// Authorization header, so each connection opens with a short-lived stream
+// token in the query string. The server ends the stream when that token
+// expires; we then fetch a new one and resume after the last event seen.
+// A resume replays a few events around that id, so ids already handled are
+// skipped. Returns a function that closes the stream.
+const SEEN_EVENTS_KEPT = 1000;
+const RECONNECT_DELAY_MS = 3000;
+
+export const subscribeToRequestEvents = (onEvent) => {
+  const seen = new Set();
+  let lastId = null;
+  let source = null;
+  let timer = null;
+  let closed = false;
+
+  const handle = (type, e) => {
+    const event = JSON.parse(e.data);
+    if (type === 'reset') {
+      onEvent(type, event);
+      return;
+    }
+    if (seen.has(event.id)) return;
+    seen.add(event.id);
+    if (seen.size > SEEN_EVENTS_KEPT) {
+      seen.delete(seen.values().next().value);
+    }
+    lastId = lastId === null ? event.id : Math.max(lastId, event.id);
+    onEvent(type, event);
+  };
+
+  const connect = async () => {
+    try {
+      const response = await api.post('/requests/stream/token');
+      if (closed) return;
+      const params = new URLSearchParams({ token: response.data.token });
+      if (lastId !== null) params.set('last_event_id', lastId);
+      source = new EventSource(`${API_URL}/requests/stream?${params}`);
+      ['created', 'status_changed', 'reset'].forEach((type) => {
+        source.addEventListener(type, (e) => handle(type, e));
+      });
+      source.onerror = () => {
+        // Expired token or dropped connection; the browser's own retry would
+        // reuse the old token, so reconnect with a new one instead
+        source.close();
+        reconnect();
+      };
+    } catch (error) {
+      reconnect();
+    }
+  };
+
+  const reconnect = () => {
+    if (!closed) timer = setTimeout(connect, RECONNECT_DELAY_MS);
+  };
+
+  connect();
+  return () => {
+    closed = true;
+    clearTimeout(timer);
+    if (source) source.close();
+  };
+};
+
 export default api;
 